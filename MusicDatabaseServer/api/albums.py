@@ -4,12 +4,22 @@ Created on Oct 22, 2019
 @author: thrasher
 """
 from flask_injector import inject
+from api.conditional import conditional_get, no_store
 from providers.DatabaseProvider import DatabaseProvider
 
 
 @inject
-def get_albums(data_provider=DatabaseProvider, quantity=None, album_id=None) -> str:
-    return data_provider().get_albums(quantity, album_id)
+def get_albums(data_provider=DatabaseProvider, quantity=None, album_id=None, limit=None, after=None,
+               band=None, min_year=None, max_year=None, style=None, country=None, type=None,
+               min_score=None, max_score=None, order_by=None, fields=None) -> str:
+    provider = data_provider()
+    filters = {'band': band, 'min_year': min_year, 'max_year': max_year, 'style': style, 'country': country,
+               'type': type, 'min_score': min_score, 'max_score': max_score}
+    if quantity and not album_id:
+        # random albums are different every time
+        return no_store(provider.get_albums(quantity, album_id, limit, after, filters, fields=fields))
+    return conditional_get(provider, lambda: provider.get_albums(quantity, album_id, limit, after, filters, order_by,
+                                                                 fields))
 
 
 @inject
@@ -22,6 +32,11 @@ def update_album(data_provider=DatabaseProvider, album=None):
     return data_provider().update_album(album)
 
 
+@inject
+def update_albums(data_provider=DatabaseProvider, albums=None):
+    return data_provider().update_albums(albums)
+
+
 @inject
 def delete_album(data_provider=DatabaseProvider, album_id=None):
     return data_provider().delete_album(album_id)
@@ -0,0 +1,34 @@
+"""
+Created on Oct 18, 2026
+
+@author: thrasher
+"""
+from flask import Response, stream_with_context
+from flask_injector import inject
+from api.conditional import conditional_get
+from providers.DatabaseProvider import DatabaseProvider
+
+
+@inject
+def export(data_provider=DatabaseProvider, tables=None, score=None):
+    provider = data_provider()
+    # keep the request context (and its database connection) while the response is streamed
+    return conditional_get(provider, lambda: Response(stream_with_context(provider.export_catalog(tables, score)),
+                                                      mimetype='application/x-ndjson'))
+
+
+@inject
+def search(data_provider=DatabaseProvider, q=None, tables=None, limit=20, after=0):
+    provider = data_provider()
+    return conditional_get(provider, lambda: provider.search(q, tables, limit, after))
+
+
+@inject
+def get_stats(data_provider=DatabaseProvider, top=None):
+    provider = data_provider()
+    return conditional_get(provider, lambda: provider.get_stats(top))
+
+
+@inject
+def get_changes(data_provider=DatabaseProvider, since=None):
+    return data_provider().get_changes(since)
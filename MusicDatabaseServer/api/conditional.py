@@ -0,0 +1,52 @@
+"""
+Created on Oct 18, 2026
+
+@author: thrasher
+"""
+from flask import request, Response
+
+# headers of the responses that change on every request
+NO_STORE_HEADERS = {'Cache-Control': 'no-store'}
+
+
+def _split_response(response):
+    """Gets the body, status and headers of the result of a provider method."""
+    if not isinstance(response, tuple):
+        response = (response, 200)
+    return (response + ({},))[:3]
+
+
+def conditional_get(data_provider, get_response):
+    """Answers a GET request using the data version of the database as ETag.
+    If the version sent in the If-None-Match header is the current one it answers 304 without getting the data.
+    The ETag is the same for every query of an endpoint whatever its parameters. It's only valid because the clients
+    keep the ETag of each URL with its response, and the responses that change on every request (like the random
+    albums and songs) don't get one, see no_store.
+    Args:
+        data_provider(DatabaseProvider): the provider to get the data version from
+        get_response(function): gets the response of the request if the data changed
+    """
+    # the version is read before the data so a concurrent write makes the next request get the data again
+    etag = str(data_provider.get_data_version())
+    if request.if_none_match.contains(etag):
+        return None, 304, {'ETag': f'"{etag}"'}
+    response = get_response()
+    if isinstance(response, Response):
+        # streamed responses
+        response.set_etag(etag)
+        return response
+    body, status, headers = _split_response(response)
+    if status == 200:
+        headers = dict(headers, ETag=f'"{etag}"')
+    return body, status, headers
+
+
+def no_store(response):
+    """Answers a GET request whose response changes on every request, like the random albums and songs.
+    It has no ETag and the clients are told not to store it, so they never get a 304 with the same random results
+    for the same URL.
+    Args:
+        response: the result of the provider method
+    """
+    body, status, headers = _split_response(response)
+    return body, status, dict(headers, **NO_STORE_HEADERS)
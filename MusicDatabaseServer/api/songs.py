@@ -4,12 +4,24 @@ Created on Oct 22, 2019
 @author: thrasher
 """
 from flask_injector import inject
+from api.conditional import conditional_get, no_store
 from providers.DatabaseProvider import DatabaseProvider
 
 
 @inject
-def get_songs(data_provider=DatabaseProvider, quantity=None, score=0.0) -> str:
-    return data_provider().get_songs(quantity, score)
+def get_songs(data_provider=DatabaseProvider, quantity=None, score=0.0, limit=None, after=None, fields=None) -> str:
+    provider = data_provider()
+    if quantity:
+        # random songs are different every time
+        return no_store(provider.get_songs(quantity, score, limit, after, fields))
+    return conditional_get(provider, lambda: provider.get_songs(quantity, score, limit, after, fields))
+
+
+@inject
+def get_playlist(data_provider=DatabaseProvider, quantity=50, score=None, band_spacing=3, album_spacing=5, history=200,
+                 continuation=None):
+    # a new playlist every time, so no ETag
+    return no_store(data_provider().get_playlist(quantity, score, band_spacing, album_spacing, history, continuation))
 
 
 @inject
@@ -22,6 +34,11 @@ def update_song(data_provider=DatabaseProvider, song=None):
     return data_provider().update_song(song)
 
 
+@inject
+def update_songs(data_provider=DatabaseProvider, songs=None):
+    return data_provider().update_songs(songs)
+
+
 @inject
 def delete_song(data_provider=DatabaseProvider, song_id=None):
     return data_provider().delete_song(song_id)
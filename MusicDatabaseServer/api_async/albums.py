@@ -0,0 +1,37 @@
+"""
+Created on Oct 18, 2026
+
+@author: thrasher
+"""
+from api_async.conditional import conditional_get, no_store
+from api_async.response import to_response
+from providers.AsyncDatabaseProvider import AsyncDatabaseProvider
+
+
+async def get_albums(request, quantity=None, album_id=None, limit=None, after=None,
+                     band=None, min_year=None, max_year=None, style=None, country=None, type=None,
+                     min_score=None, max_score=None, order_by=None, fields=None):
+    provider = AsyncDatabaseProvider()
+    filters = {'band': band, 'min_year': min_year, 'max_year': max_year, 'style': style, 'country': country,
+               'type': type, 'min_score': min_score, 'max_score': max_score}
+    if quantity and not album_id:
+        # random albums are different every time
+        return no_store(await provider.get_albums(quantity, album_id, limit, after, filters, fields=fields))
+    return await conditional_get(request, provider, lambda: provider.get_albums(quantity, album_id, limit, after,
+                                                                                filters, order_by, fields))
+
+
+async def create_album(album=None):
+    return to_response(await AsyncDatabaseProvider().create_album(album))
+
+
+async def update_album(album=None):
+    return to_response(await AsyncDatabaseProvider().update_album(album))
+
+
+async def update_albums(albums=None):
+    return to_response(await AsyncDatabaseProvider().update_albums(albums))
+
+
+async def delete_album(album_id=None):
+    return to_response(await AsyncDatabaseProvider().delete_album(album_id))
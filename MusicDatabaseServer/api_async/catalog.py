@@ -0,0 +1,43 @@
+"""
+Created on Oct 18, 2026
+
+@author: thrasher
+"""
+from aiohttp import web
+from api_async.conditional import conditional_get
+from api_async.response import to_response
+from providers.AsyncDatabaseProvider import AsyncDatabaseProvider
+
+
+async def _stream_response():
+    return web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+
+
+async def export(request, tables=None, score=None):
+    provider = AsyncDatabaseProvider()
+    response = await conditional_get(request, provider, _stream_response)
+    if response.status != 200:
+        return response
+    await response.prepare(request)
+    chunks = provider.export_catalog(tables, score)
+    try:
+        async for chunk in chunks:
+            await response.write(chunk.encode())
+    finally:
+        await chunks.aclose()
+    await response.write_eof()
+    return response
+
+
+async def search(request, q=None, tables=None, limit=20, after=0):
+    provider = AsyncDatabaseProvider()
+    return await conditional_get(request, provider, lambda: provider.search(q, tables, limit, after))
+
+
+async def get_stats(request, top=None):
+    provider = AsyncDatabaseProvider()
+    return await conditional_get(request, provider, lambda: provider.get_stats(top))
+
+
+async def get_changes(since=None):
+    return to_response(await AsyncDatabaseProvider().get_changes(since))
@@ -0,0 +1,51 @@
+"""
+Created on Oct 18, 2026
+
+@author: thrasher
+"""
+from api_async.response import to_response
+
+# headers of the responses that change on every request
+NO_STORE_HEADERS = {'Cache-Control': 'no-store'}
+
+
+def _if_none_match(request, etag):
+    """Checks if the ETag is in the If-None-Match header of the request (weak or strong)."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or any((tag[2:] if tag.startswith('W/') else tag) == f'"{etag}"' for tag in tags)
+
+
+async def conditional_get(request, data_provider, get_response):
+    """Answers a GET request using the data version of the database as ETag.
+    If the version sent in the If-None-Match header is the current one it answers 304 without getting the data.
+    The ETag is the same for every query of an endpoint whatever its parameters. It's only valid because the clients
+    keep the ETag of each URL with its response, and the responses that change on every request (like the random
+    albums and songs) don't get one, see no_store.
+    Args:
+        request(web.Request): the request to answer
+        data_provider(AsyncDatabaseProvider): the provider to get the data version from
+        get_response(function): coroutine function getting the response of the request if the data changed
+    """
+    # the version is read before the data so a concurrent write makes the next request get the data again
+    etag = str(await data_provider.get_data_version())
+    if _if_none_match(request, etag):
+        return to_response((None, 304, {'ETag': f'"{etag}"'}))
+    response = to_response(await get_response())
+    if response.status == 200:
+        response.headers['ETag'] = f'"{etag}"'
+    return response
+
+
+def no_store(result):
+    """Answers a GET request whose response changes on every request, like the random albums and songs.
+    It has no ETag and the clients are told not to store it, so they never get a 304 with the same random results
+    for the same URL.
+    Args:
+        result: the result of the provider method
+    """
+    response = to_response(result)
+    response.headers.update(NO_STORE_HEADERS)
+    return response
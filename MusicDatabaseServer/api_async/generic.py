@@ -0,0 +1,12 @@
+"""
+Created on Oct 18, 2026
+
+@author: thrasher
+"""
+from aiohttp import web
+from providers.AsyncDatabaseProvider import AsyncDatabaseProvider
+
+
+async def get():
+    body, status = AsyncDatabaseProvider().get()
+    return web.Response(text=body, status=status)
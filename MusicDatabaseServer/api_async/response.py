@@ -0,0 +1,23 @@
+"""
+Created on Oct 18, 2026
+
+@author: thrasher
+"""
+from aiohttp import web
+
+
+def to_response(result):
+    """Converts the result of a provider method to an aiohttp response, as connexion does with the Flask handlers.
+    Args:
+        result: the body or a tuple with the body, the status and optionally the headers
+    Returns:
+        web.Response: the response with the body as JSON
+    """
+    if isinstance(result, web.StreamResponse):
+        return result
+    if not isinstance(result, tuple):
+        result = (result, 200)
+    body, status, headers = (result + ({},))[:3]
+    if body is None:
+        return web.Response(status=status, headers=headers)
+    return web.json_response(body, status=status, headers=headers)
@@ -0,0 +1,38 @@
+"""
+Created on Oct 18, 2026
+
+@author: thrasher
+"""
+from api_async.conditional import conditional_get, no_store
+from api_async.response import to_response
+from providers.AsyncDatabaseProvider import AsyncDatabaseProvider
+
+
+async def get_songs(request, quantity=None, score=0.0, limit=None, after=None, fields=None):
+    provider = AsyncDatabaseProvider()
+    if quantity:
+        # random songs are different every time
+        return no_store(await provider.get_songs(quantity, score, limit, after, fields))
+    return await conditional_get(request, provider, lambda: provider.get_songs(quantity, score, limit, after, fields))
+
+
+async def get_playlist(quantity=50, score=None, band_spacing=3, album_spacing=5, history=200, continuation=None):
+    # a new playlist every time, so no ETag
+    return no_store(await AsyncDatabaseProvider().get_playlist(quantity, score, band_spacing, album_spacing,
+                                                               history, continuation))
+
+
+async def create_song(song=None):
+    return to_response(await AsyncDatabaseProvider().create_song(song))
+
+
+async def update_song(song=None):
+    return to_response(await AsyncDatabaseProvider().update_song(song))
+
+
+async def update_songs(songs=None):
+    return to_response(await AsyncDatabaseProvider().update_songs(songs))
+
+
+async def delete_song(song_id=None):
+    return to_response(await AsyncDatabaseProvider().delete_song(song_id))
@@ -4,10 +4,16 @@ Created on Oct 22, 2019
 @author: thrasher
 '''
 
+import time
+
 import connexion
+from flask import g, request, Response
 from flask_injector import FlaskInjector
 from connexion.resolver import RestyResolver
-from providers.DatabaseProvider import DatabaseProvider
+from providers.DatabaseProvider import DatabaseProvider, start_request_scope, close_request_connection, \
+    NEXT_PAGE_HEADER
+from providers.Migrations import migrate
+from providers import Metrics, QueryTrace
 from config import config
 from flask_cors import CORS
 
@@ -33,18 +39,72 @@ def token_info(access_token) -> dict:
     return {'uid': uid, 'scope': ['uid']}
 
 
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+
+
+def record_request_metrics(response):
+    if request.path != Metrics.METRICS_PATH and 'request_start' in g:
+        operation = Metrics.get_operation(request.method, request.path)
+        method, status, start, request_size = request.method, response.status_code, g.request_start, \
+            request.content_length
+        if response.is_streamed:
+            # the body (and its queries) is generated after this hook, the request ends when the response is closed
+            response.call_on_close(lambda: Metrics.observe_request(operation, method, status,
+                                                                   time.perf_counter() - start, request_size))
+        else:
+            Metrics.observe_request(operation, method, status, time.perf_counter() - start, request_size,
+                                    response.content_length)
+    return response
+
+
+def start_query_trace():
+    g.query_trace_token = QueryTrace.start_trace()
+
+
+def stop_query_trace(response):
+    token = g.get('query_trace_token')
+    if token is not None:
+        description, start = '{} {}'.format(request.method, request.full_path), g.request_start
+        if response.is_streamed:
+            # the headers are sent before the queries of the body, so the trace is only logged
+            response.call_on_close(lambda: QueryTrace.stop_trace(token, description, time.perf_counter() - start))
+        else:
+            trace = QueryTrace.stop_trace(token, description, time.perf_counter() - start)
+            response.headers[QueryTrace.QUERY_TRACE_HEADER] = trace.to_header()
+    return response
+
+
+def metrics():
+    body, content_type = Metrics.render_metrics()
+    return Response(body, content_type=content_type)
+
+
 def create_app():
+    if config.DATABASE_MIGRATE_ON_START:
+        migrate()
     conn_app = connexion.App(__name__, specification_dir='open_api/')  # Provide the app and the directory of the docs
     conn_app.add_api(
         'app_definition.yaml',
         resolver=RestyResolver('api'),
         arguments={'title': 'DatabaseServer'},
         strict_validation=True)
-    CORS(conn_app.app)
+    CORS(conn_app.app, expose_headers=[NEXT_PAGE_HEADER, 'ETag', QueryTrace.QUERY_TRACE_HEADER])
+    # one database connection (taken from the pool if enabled) for the whole request, opened when first needed
+    conn_app.app.before_request(start_request_scope)
+    conn_app.app.teardown_appcontext(close_request_connection)
+    # prometheus metrics of the requests, the queries, the connection pool and the album cache
+    conn_app.app.before_request(start_request_metrics)
+    conn_app.app.after_request(record_request_metrics)
+    # opt-in tracing of the queries of each request
+    conn_app.app.before_request(start_query_trace)
+    conn_app.app.after_request(stop_query_trace)
+    conn_app.app.add_url_rule(Metrics.METRICS_PATH, 'metrics', metrics)
     FlaskInjector(app=conn_app.app, modules=[configure])
     return conn_app
 
 
 if __name__ == '__main__':
     app = create_app()
-    app.run(port=config.SERVER_PORT, debug=True)
+    # development server only, in production the app is served by gunicorn (see wsgi.py)
+    app.run(port=config.SERVER_PORT, debug=config.SERVER_DEBUG)
@@ -0,0 +1,119 @@
+'''
+Created on Oct 18, 2026
+
+@author: thrasher
+'''
+
+import time
+
+import connexion
+from aiohttp import web
+from connexion.resolver import Resolver
+from connexion.utils import get_function_from_name
+from providers.DatabaseProvider import NEXT_PAGE_HEADER, close_all_connections
+from providers.Migrations import migrate
+from providers import Metrics, QueryTrace
+from config import config
+
+# async serving mode: the same API served by aiohttp with the handlers of api_async
+# gunicorn -c gunicorn.conf.py -k aiohttp.GunicornWebWorker async_app:app
+
+CORS_EXPOSE_HEADERS = ', '.join([NEXT_PAGE_HEADER, 'ETag', QueryTrace.QUERY_TRACE_HEADER])
+
+
+def resolve_async_function(operation_id):
+    """Gets the async handler of an operation, api.<module>.<function> is served by api_async.<module>.<function>"""
+    return get_function_from_name('api_async.' + operation_id.split('.', 1)[1])
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Allows requests from any origin, like flask_cors does for the Flask app."""
+    origin = request.headers.get('Origin')
+    if origin and request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers:
+        return web.Response(headers={
+            'Access-Control-Allow-Origin': origin,
+            'Access-Control-Allow-Methods': request.headers['Access-Control-Request-Method'],
+            'Access-Control-Allow-Headers': request.headers.get('Access-Control-Request-Headers', ''),
+            'Vary': 'Origin'})
+    response = await handler(request)
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Expose-Headers'] = CORS_EXPOSE_HEADERS
+        response.headers['Vary'] = 'Origin'
+    return response
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Records the prometheus metrics of the requests, like the before and after request hooks of the Flask app."""
+    if request.path == Metrics.METRICS_PATH:
+        return await handler(request)
+    start = time.perf_counter()
+    status = 500
+    response = None
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        # streamed responses (the export) have no body attribute
+        body = getattr(response, 'body', None)
+        Metrics.observe_request(Metrics.get_operation(request.method, request.path), request.method, status,
+                                time.perf_counter() - start, request.content_length,
+                                len(body) if isinstance(body, bytes) else None)
+
+
+@web.middleware
+async def query_trace_middleware(request, handler):
+    """Traces the queries of each request when enabled, like the before and after request hooks of the Flask app."""
+    start = time.perf_counter()
+    token = QueryTrace.start_trace()
+    if token is None:
+        return await handler(request)
+    response = None
+    try:
+        response = await handler(request)
+        return response
+    finally:
+        trace = QueryTrace.stop_trace(token, '{} {}'.format(request.method, request.path_qs),
+                                      time.perf_counter() - start)
+        # the headers of a streamed response are already sent
+        if response is not None and not response.prepared:
+            response.headers[QueryTrace.QUERY_TRACE_HEADER] = trace.to_header()
+
+
+async def metrics(request):
+    body, content_type = Metrics.render_metrics()
+    # as a header, the content_type argument of aiohttp doesn't take the charset
+    return web.Response(body=body, headers={'Content-Type': content_type})
+
+
+def create_async_app():
+    if config.DATABASE_MIGRATE_ON_START:
+        migrate()
+    # the api is served from the root path, which aiohttp only allows for the main application
+    conn_app = connexion.AioHttpApp(__name__, specification_dir='open_api/', only_one_api=True)
+    conn_app.add_api(
+        'app_definition.yaml',
+        resolver=Resolver(resolve_async_function),
+        arguments={'title': 'DatabaseServer'},
+        strict_validation=True,
+        # handlers with a request argument get the aiohttp request
+        pass_context_arg_name='request')
+    conn_app.app.middlewares.append(cors_middleware)
+    conn_app.app.middlewares.append(metrics_middleware)
+    conn_app.app.middlewares.append(query_trace_middleware)
+    conn_app.app.router.add_get(Metrics.METRICS_PATH, metrics)
+    return conn_app
+
+
+# the app loaded by gunicorn, the workers open their own database connections
+app = create_async_app().app
+close_all_connections()
+
+if __name__ == '__main__':
+    web.run_app(app, port=config.SERVER_PORT)
@@ -0,0 +1,273 @@
+'''
+Created on Oct 18, 2026
+
+@author: thrasher
+'''
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# benchmark of the endpoints of the server against a local SQLite database seeded with a synthetic catalog, so the
+# performance of DatabaseProvider can be measured without a MySQL server
+#   python benchmark.py --albums 5000 --songs 50000 --concurrency 1 8 --requests 500 --output benchmark.json
+
+# the catalog is created in the embedded SQLite database of DATABASE_PATH, a temporary file by default
+os.environ['DATABASE_BACKEND'] = 'sqlite'
+if 'DATABASE_PATH' not in os.environ:
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='musicdb_benchmark_'), 'musicdb.sqlite')
+os.environ.setdefault('APP_PORT', '2020')
+os.environ.setdefault('DATABASE_MIGRATE_ON_START', 'false')
+
+from peewee import chunked
+from config import config
+from providers import DatabaseProvider
+from providers.DatabaseProvider import Album, Favorites, database
+from providers.Migrations import migrate
+
+BANDS = 500
+STYLES = ('Black Metal', 'Death Metal', 'Doom Metal', 'Heavy Metal', 'Thrash Metal', 'Progressive Rock', 'Jazz')
+COUNTRIES = ('Norway', 'Sweden', 'Finland', 'Germany', 'USA', 'UK', 'Spain', 'Brazil')
+TYPES = ('LP', 'EP', 'Live', 'Compilation')
+SEED_CHUNK_SIZE = 500
+
+
+def seed_catalog(albums, songs, rand):
+    """Fills the database with a synthetic catalog.
+    Args:
+        albums(int): number of albums
+        songs(int): number of favorite songs, spread over the albums
+        rand(Random): the random generator of the catalog
+    """
+    with database.connection_context():
+        with database.atomic():
+            album_rows = []
+            for index in range(albums):
+                score = rand.choice(['', '?']) if rand.random() < 0.05 else '{:.1f}'.format(rand.uniform(0, 10))
+                album_rows.append({'band': 'Band {}'.format(rand.randrange(BANDS)),
+                                   'title': 'Album {}'.format(index),
+                                   'year': rand.randint(1970, 2026),
+                                   'style': rand.choice(STYLES),
+                                   'country': rand.choice(COUNTRIES),
+                                   'type': rand.choice(TYPES),
+                                   'score': score,
+                                   'score_value': DatabaseProvider.parse_score(score),
+                                   'review': 'Review of album {}'.format(index),
+                                   'copy': ''})
+            for rows in chunked(album_rows, SEED_CHUNK_SIZE):
+                Album.insert_many(rows).execute()
+            album_ids = [album_id for album_id, in Album.select(Album.id).tuples()]
+            song_rows = []
+            for index in range(songs):
+                song_rows.append({'album_id': album_ids[index % len(album_ids)],
+                                  'title': 'Song {}'.format(index),
+                                  'file_name': 'song_{}.mp3'.format(index),
+                                  'track_number': index // len(album_ids) + 1,
+                                  'score': rand.choice((0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5)),
+                                  'type': 'mp3'})
+            for rows in chunked(song_rows, SEED_CHUNK_SIZE):
+                Favorites.insert_many(rows).execute()
+
+
+class Scenarios(object):
+    """Requests of each benchmarked operation, built from the ids of the catalog."""
+
+    def __init__(self, rand):
+        self._rand = rand
+        self._lock = threading.Lock()
+        with database.connection_context():
+            self._album_ids = [album_id for album_id, in Album.select(Album.id).tuples()]
+            self._song_ids = [song_id for song_id, in Favorites.select(Favorites.id).tuples()]
+        self._created = 0
+
+    def _random(self, func, *args):
+        # the scenarios are built from several threads at once
+        with self._lock:
+            return func(*args)
+
+    def _album_id(self):
+        return self._random(self._rand.choice, self._album_ids)
+
+    def _pop(self, ids):
+        with self._lock:
+            return ids.pop(self._rand.randrange(len(ids)))
+
+    def _new_name(self, prefix):
+        with self._lock:
+            self._created += 1
+            return '{} {}'.format(prefix, self._created)
+
+    def _album(self, album_id=None):
+        album = {'band': 'Band {}'.format(self._random(self._rand.randrange, BANDS)), 'title': self._new_name('New'),
+                 'year': '2026', 'style': STYLES[0], 'country': COUNTRIES[0], 'type': TYPES[0], 'score': '7.5'}
+        if album_id is not None:
+            album['id'] = str(album_id)
+        return album
+
+    def _empty_album_id(self):
+        # albums with songs can't be deleted, so the album to delete is created without them before the request
+        with database.connection_context():
+            return Album.insert(**self._album()).execute()
+
+    def _song(self):
+        name = self._new_name('New song')
+        return {'title': name, 'file_name': name + '.mp3', 'track_number': '1', 'score': '4', 'type': 'mp3',
+                'album': {'id': str(self._album_id())}}
+
+    def get(self):
+        """Gets the scenarios by name as (operationId, function building the next (method, url, json body))."""
+        return {
+            'generic': ('api.generic.get', lambda: ('GET', '/', None)),
+            'albums_random': ('api.albums.get_albums', lambda: ('GET', '/music/albums?quantity=10', None)),
+            'albums_random_filtered': ('api.albums.get_albums',
+                                       lambda: ('GET', '/music/albums?quantity=10&min_score=7&style=Jazz', None)),
+            'albums_by_id': ('api.albums.get_albums',
+                             lambda: ('GET', '/music/albums?album_id={}'.format(self._album_id()), None)),
+            'albums_page': ('api.albums.get_albums',
+                            lambda: ('GET', '/music/albums?limit=100&after={}'.format(self._album_id()), None)),
+            'albums_page_by_score': ('api.albums.get_albums',
+                                     lambda: ('GET', '/music/albums?limit=100&order_by=-score&min_year=1990', None)),
+            'create_album': ('api.albums.create_album', lambda: ('POST', '/music/albums', self._album())),
+            'update_album': ('api.albums.update_album',
+                             lambda: ('PUT', '/music/albums', self._album(self._album_id()))),
+            'update_albums': ('api.albums.update_albums',
+                              lambda: ('PUT', '/music/albums/batch',
+                                       [self._album(self._album_id()) for _ in range(10)] + [self._album()])),
+            'songs_random': ('api.songs.get_songs', lambda: ('GET', '/music/fav_songs?quantity=20&score=3', None)),
+            'songs_page': ('api.songs.get_songs',
+                           lambda: ('GET', '/music/fav_songs?limit=100&after={}'.format(
+                               self._random(self._rand.choice, self._song_ids)), None)),
+            'playlist': ('api.songs.get_playlist', lambda: ('GET', '/music/playlist?quantity=50&score=2', None)),
+            'create_song': ('api.songs.create_song', lambda: ('POST', '/music/fav_songs', self._song())),
+            'update_song': ('api.songs.update_song', lambda: ('PUT', '/music/fav_songs', self._song())),
+            'update_songs': ('api.songs.update_songs',
+                             lambda: ('PUT', '/music/fav_songs/batch', [self._song() for _ in range(10)])),
+            'export_songs': ('api.catalog.export', lambda: ('GET', '/music/export?tables=songs&score=4.5', None)),
+            'search': ('api.catalog.search',
+                       lambda: ('GET', '/music/search?q={}'.format(self._random(self._rand.choice, STYLES)), None)),
+            'stats': ('api.catalog.get_stats', lambda: ('GET', '/music/stats?top=20', None)),
+            'changes': ('api.catalog.get_changes', lambda: ('GET', '/music/changes?since=0', None)),
+            # the last ones, the deleted songs are not in the catalog of the other scenarios anymore
+            'delete_song': ('api.songs.delete_song',
+                            lambda: ('DELETE', '/music/fav_songs?song_id={}'.format(self._pop(self._song_ids)), None)),
+            'delete_album': ('api.albums.delete_album',
+                             lambda: ('DELETE', '/music/albums?album_id={}'.format(self._empty_album_id()), None)),
+        }
+
+
+# number of queries of the request served by each thread
+_queries = threading.local()
+
+
+def _count_query(method, sql, params, seconds):
+    _queries.count = getattr(_queries, 'count', 0) + 1
+
+
+def percentile(values, percent):
+    """Gets the nearest-rank percentile of a sorted list of values."""
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, int(round(percent / 100 * len(values) + 0.5)) - 1))]
+
+
+def run_scenario(flask_app, build_request, requests, concurrency):
+    """Sends the requests of a scenario from concurrency threads.
+    Returns:
+        dict: with the latency percentiles, throughput, errors and queries per request
+    """
+    local = threading.local()
+
+    def send(_):
+        if not hasattr(local, 'client'):
+            local.client = flask_app.test_client()
+        method, url, body = build_request()
+        _queries.count = 0
+        start = time.perf_counter()
+        response = local.client.open(url, method=method, json=body)
+        # the whole body is read, streamed responses included
+        size = len(response.get_data())
+        return time.perf_counter() - start, response.status_code, _queries.count, size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency * 1000 for latency, _, _, _ in results)
+    return {'requests': requests,
+            'concurrency': concurrency,
+            'errors': sum(1 for _, status, _, _ in results if status >= 400),
+            'throughput': round(requests / elapsed, 2),
+            'latency_ms': {'mean': round(sum(latencies) / len(latencies), 3),
+                           'p50': round(percentile(latencies, 50), 3),
+                           'p95': round(percentile(latencies, 95), 3),
+                           'p99': round(percentile(latencies, 99), 3),
+                           'max': round(latencies[-1], 3)},
+            'queries_per_request': round(sum(queries for _, _, queries, _ in results) / requests, 2),
+            'response_bytes': round(sum(size for _, _, _, size in results) / requests)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the endpoints of the server against a local SQLite '
+                                                 'database with a synthetic catalog')
+    parser.add_argument('--albums', type=int, default=5000, help='number of albums of the catalog')
+    parser.add_argument('--songs', type=int, default=50000, help='number of favorite songs of the catalog')
+    parser.add_argument('--requests', type=int, default=200, help='requests sent to each scenario')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8],
+                        help='number of concurrent clients, each scenario runs once for each of them')
+    parser.add_argument('--scenarios', nargs='+', help='scenarios to run (all by default)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random catalog and requests')
+    parser.add_argument('--output', default='benchmark.json', help='file of the JSON report')
+    parser.add_argument('--log-level', default='WARNING',
+                        help='logging level of the server while benchmarking, the debug logs slow it down')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level)
+
+    if os.path.exists(config.DATABASE_PATH):
+        parser.error('{} already exists, the benchmark needs a new database'.format(config.DATABASE_PATH))
+    rand = random.Random(args.seed)
+    migrate()
+    seed_catalog(args.albums, args.songs, rand)
+    DatabaseProvider.query_listeners.append(_count_query)
+
+    import app
+    flask_app = app.create_app().app
+    scenarios = Scenarios(rand).get()
+    names = args.scenarios or list(scenarios)
+    unknown = set(names) - set(scenarios)
+    if unknown:
+        parser.error('Unknown scenarios {}, the scenarios are {}'.format(sorted(unknown), list(scenarios)))
+
+    results = []
+    for name in names:
+        operation, build_request = scenarios[name]
+        for concurrency in args.concurrency:
+            result = dict(run_scenario(flask_app, build_request, args.requests, concurrency),
+                          scenario=name, operation=operation)
+            results.append(result)
+            print('{:<24} c={:<3} {:>9.1f} req/s  p50 {:>8.2f} ms  p95 {:>8.2f} ms  p99 {:>8.2f} ms  '
+                  '{:>6.1f} queries/req  {} errors'.format(name, concurrency, result['throughput'],
+                                                           result['latency_ms']['p50'], result['latency_ms']['p95'],
+                                                           result['latency_ms']['p99'],
+                                                           result['queries_per_request'], result['errors']))
+
+    report = {'date': datetime.datetime.utcnow().isoformat(),
+              'python': platform.python_version(),
+              'sqlite': sqlite3.sqlite_version,
+              'catalog': {'albums': args.albums, 'songs': args.songs, 'seed': args.seed},
+              'results': results}
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+    print('Report saved in {}, catalog in {}'.format(args.output, config.DATABASE_PATH))
+
+
+if __name__ == '__main__':
+    main()
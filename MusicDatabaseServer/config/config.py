@@ -22,12 +22,61 @@ except Exception:
     appconf = json.load(open(os.path.join(dir_path, 'defaults/musicdb.conf.default')))
 
 # database config
+# mysql, or sqlite for an embedded database in a single file (DATABASE_PATH)
+DATABASE_BACKEND  = os.environ.get('DATABASE_BACKEND', 'mysql').lower()
 DATABASE_HOST     = os.environ.get('DATABASE_HOST')
-DATABASE_PORT     = int(os.environ.get('DATABASE_PORT'))
+DATABASE_PORT     = int(os.environ.get('DATABASE_PORT', 3306))
 DATABASE_NAME     = os.environ.get('DATABASE_NAME')
 DATABASE_USER     = os.environ.get('DATABASE_USER')
 DATABASE_PASSWORD = os.environ.get('DATABASE_PASSWORD')
 
+# embedded SQLite database config
+DATABASE_PATH                = os.environ.get('DATABASE_PATH', 'musicdb.sqlite')
+# seconds a write waits for the one running in another connection
+DATABASE_SQLITE_BUSY_TIMEOUT = int(os.environ.get('DATABASE_SQLITE_BUSY_TIMEOUT', 10))
+# megabytes of pages cached by each connection and of the file mapped in memory
+DATABASE_SQLITE_CACHE_MB     = int(os.environ.get('DATABASE_SQLITE_CACHE_MB', 64))
+DATABASE_SQLITE_MMAP_MB      = int(os.environ.get('DATABASE_SQLITE_MMAP_MB', 256))
+
+# production server config (gunicorn.conf.py)
+# the CPUs of the node are not the ones of the container, so the workers are not sized from them
+SERVER_WORKERS          = int(os.environ.get('SERVER_WORKERS', 2))
+SERVER_THREADS          = int(os.environ.get('SERVER_THREADS', 4))
+# seconds a worker has to finish its requests after a SIGTERM before it's killed
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+# seconds without answering after which a worker is restarted
+SERVER_TIMEOUT          = int(os.environ.get('SERVER_TIMEOUT', 60))
+# only for the development server (python app.py)
+SERVER_DEBUG            = os.environ.get('SERVER_DEBUG', 'false').lower() == 'true'
+
+# database connection pool config
+DATABASE_POOL_ENABLED       = os.environ.get('DATABASE_POOL_ENABLED', 'true').lower() == 'true'
+# connections to the database of all the workers of a server together, each worker has a pool with its share of them
+DATABASE_MAX_CONNECTIONS    = int(os.environ.get('DATABASE_MAX_CONNECTIONS', 20))
+DATABASE_POOL_SIZE          = int(os.environ.get('DATABASE_POOL_SIZE',
+                                                 max(1, DATABASE_MAX_CONNECTIONS // max(1, SERVER_WORKERS))))
+# seconds after which an idle connection of the pool is recycled
+DATABASE_POOL_STALE_TIMEOUT = int(os.environ.get('DATABASE_POOL_STALE_TIMEOUT', 300))
+# seconds to wait for a free connection when the pool is exhausted
+DATABASE_POOL_WAIT_TIMEOUT  = int(os.environ.get('DATABASE_POOL_WAIT_TIMEOUT', 10))
+
+# apply the pending schema migrations when the server starts (otherwise run migrate.py)
+DATABASE_MIGRATE_ON_START = os.environ.get('DATABASE_MIGRATE_ON_START', 'true').lower() == 'true'
+
+# query tracing: log the slow queries and requests, and report the queries of each request in a response header
+DATABASE_QUERY_TRACE_ENABLED   = os.environ.get('DATABASE_QUERY_TRACE_ENABLED', 'false').lower() == 'true'
+# seconds after which a query is logged as slow
+DATABASE_SLOW_QUERY_SECONDS    = float(os.environ.get('DATABASE_SLOW_QUERY_SECONDS', 0.1))
+# queries run by a request and seconds it takes after which it's logged with all its queries
+DATABASE_SLOW_REQUEST_QUERIES  = int(os.environ.get('DATABASE_SLOW_REQUEST_QUERIES', 20))
+DATABASE_SLOW_REQUEST_SECONDS  = float(os.environ.get('DATABASE_SLOW_REQUEST_SECONDS', 0.5))
+
+# maximum number of albums kept in memory by the album cache
+ALBUM_CACHE_SIZE = int(os.environ.get('ALBUM_CACHE_SIZE', 10000))
+
+# versions of the data kept in the changes log, the clients with an older version have to sync everything again
+CHANGES_RETENTION_VERSIONS = int(os.environ.get('CHANGES_RETENTION_VERSIONS', 100000))
+
 ACCESS_TOKEN      = os.environ.get('ACCESS_TOKEN')
 
 SERVER_PORT = int(os.environ.get('APP_PORT'))
@@ -0,0 +1,46 @@
+'''
+Created on Oct 18, 2026
+
+@author: thrasher
+'''
+
+# gunicorn configuration of the production server, see wsgi.py
+import os
+
+# the workers write their metrics in PROMETHEUS_MULTIPROC_DIR, the files of a previous run are removed before any
+# metric is created
+_metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if _metrics_dir:
+    os.makedirs(_metrics_dir, exist_ok=True)
+    for _name in os.listdir(_metrics_dir):
+        os.remove(os.path.join(_metrics_dir, _name))
+
+# not imported as config, which is a gunicorn setting
+from config import config as app_config
+from providers import Metrics
+
+bind = f'0.0.0.0:{app_config.SERVER_PORT}'
+workers = app_config.SERVER_WORKERS
+threads = app_config.SERVER_THREADS
+# load the app (and apply the migrations) once before forking the workers
+preload_app = True
+# on SIGTERM (kubernetes stopping the pod) the workers stop accepting connections and finish the running requests
+graceful_timeout = app_config.SERVER_GRACEFUL_TIMEOUT
+timeout = app_config.SERVER_TIMEOUT
+# seconds an idle keep-alive connection is kept open
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    if app_config.DATABASE_POOL_ENABLED and \
+            app_config.SERVER_WORKERS * app_config.DATABASE_POOL_SIZE > app_config.DATABASE_MAX_CONNECTIONS:
+        server.log.warning('%s workers with pools of %s connections can open more than the %s DATABASE_MAX_CONNECTIONS',
+                           app_config.SERVER_WORKERS, app_config.DATABASE_POOL_SIZE,
+                           app_config.DATABASE_MAX_CONNECTIONS)
+
+
+def child_exit(server, worker):
+    # the metrics of the workers are aggregated when PROMETHEUS_MULTIPROC_DIR is set, drop the gauges of a dead one
+    Metrics.mark_process_dead(worker.pid)
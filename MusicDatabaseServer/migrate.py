@@ -0,0 +1,34 @@
+'''
+Created on Oct 18, 2026
+
+@author: thrasher
+'''
+
+import argparse
+
+from providers.Migrations import migrate, get_migrations_status
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Applies the schema migrations of the music database')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('status', help='list the migrations and when they were applied')
+    apply_parser = subparsers.add_parser('apply', help='apply the pending migrations')
+    apply_parser.add_argument('--to', help='name of the last migration to apply')
+    apply_parser.add_argument('--fake', action='store_true',
+                              help='record the migrations as applied without running them')
+    args = parser.parse_args()
+
+    if args.command == 'apply':
+        applied = migrate(target=args.to, fake=args.fake)
+        if not applied:
+            print('No migrations to apply')
+        for name in applied:
+            print('Applied {}'.format(name))
+    else:
+        for name, applied_at in get_migrations_status():
+            print('{} {}'.format(name, applied_at if applied_at else 'pending'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Async version of the DatabaseProvider used by the aiohttp server (async_app.py).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import threading
+
+from config import config
+from providers.DatabaseProvider import DatabaseProvider, EXPORT_CHUNK_SIZE
+
+# the queries can't run in more threads than connections the pool has, the rest of the requests wait in the event loop
+_executor = ThreadPoolExecutor(max_workers=config.DATABASE_POOL_SIZE, thread_name_prefix='database')
+# chunks of lines of an export read before the client gets them
+EXPORT_READ_AHEAD = 2
+
+
+def _next_lines(lines, quantity):
+    """Gets at most quantity items of the iterator lines."""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= quantity:
+            break
+    return chunk
+
+
+class AsyncDatabaseProvider(object):
+    """Awaitable methods of the DatabaseProvider.
+    The queries run in a pool of threads sized like the database connection pool, so a request waiting on MySQL
+    doesn't block the event loop and the caches, samplers and data versioning are the ones of DatabaseProvider.
+    """
+
+    def __init__(self):
+        self._provider = DatabaseProvider()
+
+    @staticmethod
+    async def _run(method, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        # the context of the request (like its query trace) goes along to the thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_executor, functools.partial(context.run, method, *args, **kwargs))
+
+    async def get_data_version(self):
+        return await self._run(self._provider.get_data_version)
+
+    async def get_songs(self, quantity=None, score=None, limit=None, after=None, fields=None):
+        return await self._run(self._provider.get_songs, quantity, score, limit, after, fields)
+
+    async def get_playlist(self, quantity, score=None, band_spacing=0, album_spacing=0, history=0,
+                           continuation=None):
+        return await self._run(self._provider.get_playlist, quantity, score, band_spacing, album_spacing, history,
+                               continuation)
+
+    async def create_song(self, song):
+        return await self._run(self._provider.create_song, song)
+
+    async def update_song(self, song):
+        return await self._run(self._provider.update_song, song)
+
+    async def update_songs(self, songs):
+        return await self._run(self._provider.update_songs, songs)
+
+    async def delete_song(self, song_id):
+        return await self._run(self._provider.delete_song, song_id)
+
+    async def get_albums(self, quantity, album_id, limit=None, after=None, filters=None, order_by=None, fields=None):
+        return await self._run(self._provider.get_albums, quantity, album_id, limit, after, filters, order_by, fields)
+
+    async def create_album(self, album):
+        return await self._run(self._provider.create_album, album)
+
+    async def update_album(self, album):
+        return await self._run(self._provider.update_album, album)
+
+    async def update_albums(self, albums):
+        return await self._run(self._provider.update_albums, albums)
+
+    async def delete_album(self, album_id):
+        return await self._run(self._provider.delete_album, album_id)
+
+    async def get_changes(self, since):
+        return await self._run(self._provider.get_changes, since)
+
+    async def search(self, q, tables=None, limit=20, after=0):
+        return await self._run(self._provider.search, q, tables, limit, after)
+
+    async def get_stats(self, top=None):
+        return await self._run(self._provider.get_stats, top)
+
+    async def export_catalog(self, tables=None, score=None):
+        """Async iterator over the chunks of lines of DatabaseProvider.export_catalog.
+        The export is read in a thread of the pool of the queries, which keeps the database connection of the export
+        until it ends, so the exports don't use more threads and connections than the pool has.
+        Args:
+            tables([str]): the tables to export
+            score(float): minimum score of the songs to export
+        Yields:
+            str: the next EXPORT_CHUNK_SIZE lines of the export
+        """
+        loop = asyncio.get_event_loop()
+        chunks = asyncio.Queue(maxsize=EXPORT_READ_AHEAD)
+        stopped = threading.Event()
+
+        def put(item):
+            # waits while the client is EXPORT_READ_AHEAD chunks behind
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def read_chunks():
+            lines = self._provider.export_catalog(tables, score)
+            try:
+                while not stopped.is_set():
+                    chunk = _next_lines(lines, EXPORT_CHUNK_SIZE)
+                    put(chunk)
+                    if not chunk:
+                        break
+            except Exception as ex:
+                # raised by the iterator in the event loop
+                put(ex)
+            finally:
+                # closing the generator closes its connection, also when the client goes away in the middle
+                lines.close()
+
+        reader = asyncio.ensure_future(self._run(read_chunks))
+        try:
+            while True:
+                chunk = await chunks.get()
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if not chunk:
+                    break
+                yield ''.join(chunk)
+        finally:
+            stopped.set()
+            # the reader may be waiting to put a chunk, then it sees it has to stop
+            while not chunks.empty():
+                chunks.get_nowait()
+            await reader
+
+    def get(self):
+        return self._provider.get()
@@ -1,6 +1,21 @@
 from peewee import *
+from playhouse.mysql_ext import Match
+from playhouse.pool import PooledDatabase, PooledMySQLDatabase, PooledSqliteDatabase, MaxConnectionsExceeded
+from providers.LruCache import LruCache
+from providers.RandomSampler import RandomSampler
+from providers import Playlist
 from config import config
+import functools
+import inspect
+import json
 import logging
+import math
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
 
 # set log configuration
 log_level = logging.getLevelName(config.LOGGING_LEVEL)
@@ -11,15 +26,212 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# set database configuration
-database = MySQLDatabase(config.DATABASE_NAME,
-                         **{'charset': 'utf8mb4',
-                            'sql_mode': 'PIPES_AS_CONCAT',
-                            'use_unicode': True,
-                            'host': config.DATABASE_HOST,
-                            'port': config.DATABASE_PORT,
-                            'user': config.DATABASE_USER,
-                            'password': config.DATABASE_PASSWORD})
+# maximum number of ids in a single IN (...) clause
+IDS_CHUNK_SIZE = 500
+# response header with the cursor of the next page when paginating
+NEXT_PAGE_HEADER = 'X-Next-After'
+# tables that can be exported and number of rows read from the database at once when exporting
+EXPORT_TABLES = ('albums', 'songs')
+EXPORT_CHUNK_SIZE = 1000
+# tables that can be searched and maximum number of words of a search
+SEARCH_TABLES = ('albums', 'songs')
+MAX_SEARCH_WORDS = 10
+SEARCH_WORD = re.compile(r'\w+')
+# versions of the data between the deletions of the changes older than config.CHANGES_RETENTION_VERSIONS
+CHANGES_PRUNE_INTERVAL = 1000
+
+
+# callables called after each query with the DatabaseProvider method running it, the sql, its params and the seconds
+# it took (see providers/Metrics.py)
+query_listeners = []
+# DatabaseProvider method running in each thread
+_current_method = threading.local()
+# threads serving a request, whose database connection is kept open until the request ends
+_request_scope = threading.local()
+
+
+def get_current_method():
+    """Gets the name of the DatabaseProvider method running in this thread, or None if there is none."""
+    return getattr(_current_method, 'name', None)
+
+
+class QueryListenersMixin(object):
+    """Database mixin timing each query and notifying it to the query_listeners."""
+
+    def execute_sql(self, sql, params=None, *args, **kwargs):
+        if not query_listeners:
+            return super().execute_sql(sql, params, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, params, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            for listener in query_listeners:
+                listener(get_current_method(), sql, params, duration)
+
+
+class MonitoredPoolMixin(object):
+    """Pooled database mixin that keeps track of the time spent waiting for a connection of the pool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool_wait_stats = {'acquired': 0,
+                                 'timeouts': 0,
+                                 'wait_seconds_total': 0.0,
+                                 'wait_seconds_max': 0.0}
+
+    def connect(self, reuse_if_open=False):
+        start = time.monotonic()
+        try:
+            opened = super().connect(reuse_if_open)
+        except MaxConnectionsExceeded:
+            with self._pool_lock:
+                self._pool_wait_stats['timeouts'] += 1
+            raise
+        # reusing the connection already open for this thread is not an acquisition from the pool
+        if opened:
+            wait = time.monotonic() - start
+            with self._pool_lock:
+                self._pool_wait_stats['acquired'] += 1
+                self._pool_wait_stats['wait_seconds_total'] += wait
+                self._pool_wait_stats['wait_seconds_max'] = max(self._pool_wait_stats['wait_seconds_max'], wait)
+        return opened
+
+    def get_pool_stats(self):
+        """Gets the usage and waiting statistics of the pool.
+        Returns:
+            dict: with the stats of the pool
+        """
+        with self._pool_lock:
+            stats = dict(self._pool_wait_stats)
+            stats.update({'max_connections': self._max_connections,
+                          'in_use': len(self._in_use),
+                          'idle': len(self._connections)})
+        return stats
+
+
+class EmbeddedSqliteMixin(object):
+    """SQLite database mixin answering the queries written for MySQL (SQLite 3.35 or newer)."""
+    # the upserts return the id of the row inserted or updated, instead of the LAST_INSERT_ID trick of MySQL
+    returning_clause = True
+
+    def begin(self, lock_type=None):
+        # the transactions take the write lock when they start, so one reading first doesn't fail with the database
+        # locked when it writes later
+        return super().begin(lock_type or 'IMMEDIATE')
+
+    def conflict_update(self, oc, query):
+        # the MySQL upserts don't name the unique key, SQLite matches any of them when the target is left out
+        if oc._preserve and not oc._conflict_target:
+            return self._build_on_conflict_update(oc, query)
+        return super().conflict_update(oc, query)
+
+
+class ListenedMySQLDatabase(QueryListenersMixin, MySQLDatabase):
+    """MySQL database notifying its queries to the query_listeners."""
+
+
+class MonitoredPooledMySQLDatabase(MonitoredPoolMixin, QueryListenersMixin, PooledMySQLDatabase):
+    """Pooled MySQL database that keeps track of the time spent waiting for a connection of the pool.
+    It notifies its queries to the query_listeners as well.
+    """
+
+
+class EmbeddedSqliteDatabase(EmbeddedSqliteMixin, QueryListenersMixin, SqliteDatabase):
+    """SQLite database notifying its queries to the query_listeners."""
+
+
+class MonitoredPooledSqliteDatabase(MonitoredPoolMixin, EmbeddedSqliteMixin, QueryListenersMixin,
+                                    PooledSqliteDatabase):
+    """Pooled SQLite database, so the pragmas are not set again on every request."""
+
+
+def create_database():
+    """Creates the database of the configured backend.
+    Returns:
+        Database: the MySQL server database or the embedded SQLite one
+    """
+    if config.DATABASE_BACKEND == 'sqlite':
+        if sqlite3.sqlite_version_info < (3, 35, 0):
+            raise RuntimeError('The sqlite backend needs SQLite 3.35 or newer, found {}'.format(sqlite3.sqlite_version))
+        # readers don't block the writer and the other way around, and the commits don't wait for the disk.
+        # The busy timeout is a pragma because the timeout argument of the pool is the wait for a connection.
+        # The foreign keys are checked like in MySQL, songs of unknown albums are rejected
+        params = {'pragmas': {'foreign_keys': 1,
+                              'journal_mode': 'wal',
+                              'synchronous': 'normal',
+                              'busy_timeout': 1000 * config.DATABASE_SQLITE_BUSY_TIMEOUT,
+                              'cache_size': -1024 * config.DATABASE_SQLITE_CACHE_MB,
+                              'mmap_size': 1024 * 1024 * config.DATABASE_SQLITE_MMAP_MB,
+                              'temp_store': 'memory'}}
+        if config.DATABASE_POOL_ENABLED:
+            # a connection of the pool is used by a thread at a time, but not always by the same one
+            return MonitoredPooledSqliteDatabase(config.DATABASE_PATH,
+                                                 max_connections=config.DATABASE_POOL_SIZE,
+                                                 stale_timeout=config.DATABASE_POOL_STALE_TIMEOUT,
+                                                 timeout=config.DATABASE_POOL_WAIT_TIMEOUT,
+                                                 check_same_thread=False,
+                                                 **params)
+        return EmbeddedSqliteDatabase(config.DATABASE_PATH, **params)
+    if config.DATABASE_BACKEND != 'mysql':
+        raise ValueError('Unknown database backend {}'.format(config.DATABASE_BACKEND))
+    connection_params = {'charset': 'utf8mb4',
+                         'sql_mode': 'PIPES_AS_CONCAT',
+                         'use_unicode': True,
+                         'host': config.DATABASE_HOST,
+                         'port': config.DATABASE_PORT,
+                         'user': config.DATABASE_USER,
+                         'password': config.DATABASE_PASSWORD}
+    if config.DATABASE_POOL_ENABLED:
+        return MonitoredPooledMySQLDatabase(config.DATABASE_NAME,
+                                            max_connections=config.DATABASE_POOL_SIZE,
+                                            stale_timeout=config.DATABASE_POOL_STALE_TIMEOUT,
+                                            timeout=config.DATABASE_POOL_WAIT_TIMEOUT,
+                                            **connection_params)
+    return ListenedMySQLDatabase(config.DATABASE_NAME, **connection_params)
+
+
+database = create_database()
+
+
+def get_connection_pool_stats():
+    """Gets the statistics of the connection pool.
+    Returns:
+        dict: with the stats of the pool or empty if the pool is not enabled
+    """
+    if isinstance(database, MonitoredPoolMixin):
+        return database.get_pool_stats()
+    return {}
+
+
+def close_all_connections():
+    """Closes all the database connections, including the idle ones of the pool.
+    Used before forking the server workers so they don't share the connections opened while loading the app.
+    """
+    if isinstance(database, PooledDatabase):
+        database.close_all()
+    elif not database.is_closed():
+        database.close()
+
+
+def start_request_scope():
+    """Starts the scope of the database connection of the current request.
+    The connection is opened (or got from the pool) by the first DatabaseProvider method the request calls and kept
+    open until the request ends, so the requests not using the database (like /metrics, the CORS preflights or the
+    readiness probe) don't take one.
+    """
+    _request_scope.active = True
+
+
+def close_request_connection(exc=None):
+    """Closes (or gives back to the pool) the database connection of the current request, if it opened one."""
+    _request_scope.active = False
+    if not database.is_closed():
+        database.close()
+
+
+def _in_request_scope():
+    return getattr(_request_scope, 'active', False)
 
 
 class BaseModel(Model):
@@ -33,6 +245,8 @@ class Album(BaseModel):
     band = CharField(column_name='groupName', constraints=[SQL("DEFAULT ' '")])
     country = CharField(column_name='loc', constraints=[SQL("DEFAULT ' '")])
     score = CharField(column_name='mark', constraints=[SQL("DEFAULT ' '")])
+    # numeric copy of the score for filtering and ordering in the database, null if the score is not a number
+    score_value = FloatField(column_name='mark_value', null=True, index=True)
     review = TextField(null=True)
     style = CharField(constraints=[SQL("DEFAULT ' '")])
     title = CharField(constraints=[SQL("DEFAULT ' '")])
@@ -41,6 +255,34 @@ class Album(BaseModel):
 
     class Meta:
         table_name = 'music'
+        # created in the databases by the migrations
+        indexes = ((('band', 'title', 'year'), False),
+                   (('year',), False),
+                   (('style',), False),
+                   (('country',), False),
+                   (('type',), False))
+
+
+class DataVersion(BaseModel):
+    """Single row table with the version of the data, increased on every write"""
+    id = AutoField()
+    version = BigIntegerField(default=0)
+
+    class Meta:
+        table_name = 'data_version'
+
+
+class Change(BaseModel):
+    """Log of the rows of the music and favorites tables changed in each version of the data"""
+    id = AutoField()
+    version = BigIntegerField(index=True)
+    # 'album' or 'song'
+    entity = CharField()
+    row_id = IntegerField()
+    deleted = BooleanField(default=False)
+
+    class Meta:
+        table_name = 'changes'
 
 
 class Favorites(BaseModel):
@@ -54,87 +296,456 @@ class Favorites(BaseModel):
 
     class Meta:
         table_name = 'favorites'
+        # created in the databases by the migrations
+        indexes = ((('album_id', 'title'), True),
+                   (('album_id', 'file_name'), True),
+                   (('score',), False))
+
+
+# albums without a numeric score (and legacy favorites without score) are sorted first in the ids indexes
+NO_SCORE = float('-inf')
+
+
+def _scored(rows):
+    """Gets the rows of a sampler with NO_SCORE instead of the null scores (their second value), so they can be sorted."""
+    return ((row[0], NO_SCORE if row[1] is None else row[1]) + row[2:] for row in rows)
+
+
+# ids indexes to get random favorites and albums without ordering the tables by RAND(). They are synced with the data
+# version before sampling, so they are valid for several server processes
+favorites_sampler = RandomSampler(lambda: _scored(Favorites.select(Favorites.id, Favorites.score).tuples()))
+albums_sampler = RandomSampler(lambda: _scored(Album.select(Album.id, Album.score_value).tuples()))
+# favorites with their album and band, drawn for the playlists with a weight that grows with the score
+playlist_sampler = RandomSampler(lambda: _scored(Favorites.select(Favorites.id, Favorites.score, Favorites.album_id,
+                                                                  Album.band)
+                                                 .join(Album, on=(Favorites.album_id == Album.id)).tuples()),
+                                 weight=lambda score: 1 + max(score, 0))
+
+
+def parse_score(score):
+    """Gets the numeric value of an album score.
+    Args:
+        score(str): the score of the album
+    Returns:
+        float: the score as a number or None if it's not a number
+    """
+    try:
+        value = float(score)
+    except (ValueError, TypeError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+# fields the albums can be sorted by
+ALBUM_ORDER_FIELDS = {'id': Album.id,
+                      'band': Album.band,
+                      'title': Album.title,
+                      'year': Album.year,
+                      'score': Album.score_value}
+
+
+# fields of the albums and favorite songs exposed by the API, that can be selected with the fields parameter
+ALBUM_FIELDS = tuple(field.name for field in Album._meta.sorted_fields if field is not Album.score_value)
+SONG_FIELDS = tuple(field.name for field in Favorites._meta.sorted_fields)
+# full-text indexes (FULLTEXT in MySQL, FTS5 tables in SQLite) and their fields, created by the migrations
+ALBUM_SEARCH_INDEX = 'music_search'
+ALBUM_SEARCH_FIELDS = (Album.band, Album.title, Album.review)
+SONG_SEARCH_INDEX = 'favorites_search'
+SONG_SEARCH_FIELDS = (Favorites.title,)
+
+
+def select_albums(fields=None):
+    """Gets the query selecting the albums with the fields exposed by the API, leaving out the internal columns.
+    Args:
+        fields([str]): if given only these fields of ALBUM_FIELDS and the id are selected
+    """
+    return Album.select(*[Album._meta.fields[name] for name in ALBUM_FIELDS
+                          if fields is None or name == 'id' or name in fields])
+
+
+def pick_fields(row, fields):
+    """Gets a row with only the given fields and the id.
+    Args:
+        row(dict): the row to pick the fields from
+        fields([str]): the fields to pick. If None all the fields are kept
+    Returns:
+        dict: the row with only the given fields, a copy if they are not all the fields of the row
+    """
+    if fields is None:
+        return row
+    return {name: value for name, value in row.items() if name == 'id' or name in fields}
+
+
+# albums by id, synced with the changes log so it's valid for several server processes
+album_cache = LruCache(config.ALBUM_CACHE_SIZE)
+# catalog statistics of the last data version they were computed for
+_stats_cache = {'version': None, 'stats': None}
+_stats_lock = threading.Lock()
+
+
+def get_album_cache_stats():
+    """Gets the usage statistics of the album cache.
+    Returns:
+        dict: with the stats of the cache
+    """
+    return album_cache.get_stats()
 
 
 def database_mgmt(func):
     """
         Function decorator for opening/closing the database. Useful for each method that requires access to the database
+        If the connection was already open (by the request or by an outer call) it is reused and left open. Inside the
+        scope of a request the connection opened is left open for the rest of the request.
     """
 
     def wrapper_do_open_close(*args, **kwargs):
-        database.connect(reuse_if_open=True)
-        ex = None
+        opened = database.connect(reuse_if_open=True)
+        # the queries are accounted to the outermost method
+        outermost = get_current_method() is None
+        if outermost:
+            _current_method.name = func.__name__
         try:
-            ret = func(*args, **kwargs)
-        except Exception as ex:
-            logger.warning('Holding exception to close Database')
-            if not database.is_closed():
+            return func(*args, **kwargs)
+        finally:
+            if outermost:
+                _current_method.name = None
+            if opened and not _in_request_scope() and not database.is_closed():
                 database.close()
-            raise (ex)
-        if not database.is_closed():
-            database.close()
-        return ret
 
+    def wrapper_do_open_close_generator(*args, **kwargs):
+        # the connection has to be open while the generator is consumed, not only when it is created
+        opened = database.connect(reuse_if_open=True)
+        outermost = get_current_method() is None
+        if outermost:
+            _current_method.name = func.__name__
+        try:
+            yield from func(*args, **kwargs)
+        finally:
+            if outermost:
+                _current_method.name = None
+            if opened and not _in_request_scope() and not database.is_closed():
+                database.close()
+
+    if inspect.isgeneratorfunction(func):
+        return wrapper_do_open_close_generator
     return wrapper_do_open_close
 
 
 class DatabaseProvider(object):
 
+    @staticmethod
+    def _data_changed(albums=(), songs=(), deleted_albums=(), deleted_songs=()):
+        """Increases the version of the data, logs the changed rows with it and invalidates what depends on them.
+        It should be called in the same transaction of the changes. What depends on them is invalidated after the
+        transaction commits, otherwise a request in between could load it again from the data before the changes.
+        Args:
+            albums([int]): the ids of the albums created or updated
+            songs([int]): the ids of the favorite songs created or updated
+            deleted_albums([int]): the ids of the albums deleted
+            deleted_songs([int]): the ids of the favorite songs deleted
+        """
+        # part of the transaction of the caller if there is one, without a savepoint
+        with database.transaction():
+            if database.returning_clause:
+                version = next(iter(DataVersion.update(version=DataVersion.version + 1)
+                                    .returning(DataVersion.version).tuples().execute()))[0]
+            else:
+                # the new version is the last insert id of the connection, so it doesn't have to be read again
+                version = database.execute(
+                    DataVersion.update(version=fn.LAST_INSERT_ID(DataVersion.version + 1))).lastrowid
+            changes = [{'version': version, 'entity': entity, 'row_id': row_id, 'deleted': deleted}
+                       for entity, row_ids, deleted in (('album', albums, False), ('song', songs, False),
+                                                        ('album', deleted_albums, True),
+                                                        ('song', deleted_songs, True))
+                       for row_id in row_ids if row_id is not None]
+            for start in range(0, len(changes), IDS_CHUNK_SIZE):
+                Change.insert_many(changes[start:start + IDS_CHUNK_SIZE]).as_rowcount().execute()
+            if version % CHANGES_PRUNE_INTERVAL == 0:
+                # the log keeps only the last CHANGES_RETENTION_VERSIONS versions
+                Change.delete().where(Change.version <= version - config.CHANGES_RETENTION_VERSIONS).execute()
+            database.after_commit(functools.partial(DatabaseProvider._invalidate, list(albums), list(songs),
+                                                    list(deleted_albums), list(deleted_songs)))
+
+    @staticmethod
+    def _invalidate(albums, songs, deleted_albums, deleted_songs):
+        """Invalidates the caches and samplers depending on the given changed rows (see _data_changed)."""
+        if albums or deleted_albums:
+            album_cache.invalidate(albums + deleted_albums)
+            albums_sampler.invalidate()
+        if songs or deleted_songs or deleted_albums:
+            favorites_sampler.invalidate()
+        # the band of the albums is in the playlist sampler as well
+        playlist_sampler.invalidate()
+
     @database_mgmt
-    def _search_song_by_title_and_album_id(self, song_title, album_id):
+    def get_data_version(self):
+        """Gets the current version of the data. It increases on every create, update or delete.
+        Returns:
+            int: the version of the data
         """
-            Gets a song from the favorites table by song title and album id.
+        return DataVersion.select(DataVersion.version).scalar() or 0
+
+    def _sync_album_cache(self):
+        """Removes from the album cache the albums changed by any server process since the version it is synced with."""
+        version = self.get_data_version()
+        if album_cache.version is None:
+            album_cache.clear(version)
+        elif version != album_cache.version:
+            query = Change.select(Change.row_id).where((Change.entity == 'album') &
+                                                       (Change.version > album_cache.version) &
+                                                       (Change.version <= version))
+            album_cache.invalidate([row_id for row_id, in query.tuples()], version)
+
+    def _sync_sampler(self, sampler):
+        """Makes the sampler reload its index if any server process changed the data since it was loaded."""
+        sampler.sync(self.get_data_version())
+
+    def _get_albums_by_ids(self, album_ids):
+        """Gets albums from the album cache, reading from the database only the ones that are not cached.
+        Args:
+            album_ids([int]): the ids of the albums to get
+        Returns:
+            dict: with the ids as keys and the albums found as values
         """
-        result = Favorites.select().where((Favorites.album_id == album_id) & (Favorites.title == song_title))
-        return [row for row in result.dicts()]
+        self._sync_album_cache()
+        generation = album_cache.get_generation()
+        albums = album_cache.get_many(album_ids)
+        missing_ids = [album_id for album_id in album_ids if album_id not in albums]
+        if missing_ids:
+            loaded = {album['id']: album for album in self._get_rows_by_ids(select_albums(), Album.id, missing_ids)}
+            album_cache.put_many(loaded, generation)
+            albums.update(loaded)
+        return albums
 
-    def _get_album_for_song(self, song):
-        """Fills in the album info for a given song
+    def _add_albums_to_songs(self, songs, album_fields=None):
+        """Fills in the album info of the given songs.
         Args:
-            song(dict): the song to fill the info for
+            songs([dict]): the songs to fill the info for
+            album_fields([str]): if given only these fields and the id of the albums are filled in
+        Returns:
+            [dict]: the songs with their album, leaving out the ones whose album was not found
         """
-        if song and song['album_id']:
-            album_list, result = self.get_albums(None, song['album_id'])
-            if result == 200:
-                song['album'] = album_list[0]
+        albums = self._get_albums_by_ids(list({song['album_id'] for song in songs}))
+        result = []
+        for song in songs:
+            album = albums.get(song['album_id'])
+            if album:
+                song['album'] = pick_fields(album, album_fields)
+                result.append(song)
             else:
                 logger.error(f"Could not find album for song with album id {song['album_id']} and song id {song['id']}")
-                return None
-            return song
+        return result
+
+    @staticmethod
+    def _get_rows_by_ids(query, id_field, ids):
+        """Gets the rows of the query matching the given ids, in chunks of IDS_CHUNK_SIZE ids per IN clause.
+        Args:
+            query(Select): the query to filter by ids
+            id_field(Field): the id field to filter by
+            ids([int]): the ids of the rows to get
+        Returns:
+            [dict]: list with the rows found
+        """
+        rows = []
+        for start in range(0, len(ids), IDS_CHUNK_SIZE):
+            rows.extend(query.where(id_field.in_(ids[start:start + IDS_CHUNK_SIZE])).dicts())
+        return rows
+
+    @staticmethod
+    def _get_page(query, id_field, limit, after=None, order_field=None, descending=False):
+        """Gets a page of rows of the query using keyset pagination on the id.
+        Args:
+            query(Select): the query to paginate
+            id_field(Field): the id field to paginate by
+            limit(int): the maximum number of rows of the page
+            after(int): the id after which the page starts. If not given it will get the first page
+            order_field(Field): if given the rows are sorted by this field first, and then by id
+            descending(bool): if the rows are sorted by order_field in descending order
+        Raises:
+            ValueError: if the rows are sorted by order_field and the row of after does not exist
+        Returns:
+            ([dict], dict): the rows of the page and the headers with the cursor of the next page if there is one
+        """
+        limit = int(limit)
+        if order_field is None:
+            if after:
+                query = query.where(id_field > after)
+            query = query.order_by(id_field)
         else:
-            logger.error(f"Could not get a song or album id for {song}")
-            return None
+            if after:
+                query = query.where(DatabaseProvider._after_row_condition(id_field, after, order_field, descending))
+            query = query.order_by(order_field.desc() if descending else order_field.asc(), id_field)
+        # one more row tells if there is a next page
+        rows = list(query.limit(limit + 1).dicts())
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers[NEXT_PAGE_HEADER] = str(rows[-1]['id'])
+        return rows, headers
+
+    @staticmethod
+    def _after_row_condition(id_field, after, order_field, descending):
+        """Gets the condition of the rows sorted after the given one by order_field and then by id.
+        Nulls are sorted first in ascending order and last in descending order, as MySQL does.
+        """
+        after_rows = list(id_field.model.select(order_field).where(id_field == after).tuples())
+        if not after_rows:
+            raise ValueError(f'There is no row with id {after} to start the page after')
+        value = after_rows[0][0]
+        same_value_after = (id_field > after) & (order_field.is_null() if value is None else order_field == value)
+        if value is None:
+            return same_value_after if descending else same_value_after | order_field.is_null(False)
+        if descending:
+            return (order_field < value) | same_value_after | order_field.is_null()
+        return (order_field > value) | same_value_after
+
+    def _iter_by_chunks(self, query, id_field):
+        """Iterates over all the rows of the query reading them from the database in chunks ordered by id.
+        Args:
+            query(Select): the query to iterate over
+            id_field(Field): the id field to order by
+        Yields:
+            [dict]: each chunk of rows of the query
+        """
+        after = None
+        while True:
+            rows, headers = self._get_page(query, id_field, EXPORT_CHUNK_SIZE, after)
+            yield rows
+            if NEXT_PAGE_HEADER not in headers:
+                break
+            after = int(headers[NEXT_PAGE_HEADER])
+
+    @staticmethod
+    def _sort_by_ids(rows, ids):
+        """Sorts the rows got from the database in the same order of the given list of ids."""
+        positions = {row_id: position for position, row_id in enumerate(ids)}
+        return sorted(rows, key=lambda row: positions[row['id']])
 
     @database_mgmt
-    def get_songs(self, quantity=None, score=None):
+    def get_songs(self, quantity=None, score=None, limit=None, after=None, fields=None):
         """Get songs from the favorites table by quantity and score
         Args:
             quantity(int): limit of songs to retrieve
             score(float): minimum score of songs to retrieve (Values are from 0 to 10, but no validation is done here)
+            limit(int): if quantity is not given, the maximum number of songs of the page to retrieve
+            after(int): the song id after which the page starts
+            fields([str]): if given only these fields of SONG_FIELDS and the id are retrieved. 'album' adds the whole
+                album of the songs and 'album.<field>' only the given fields of ALBUM_FIELDS of the album
         Returns:
             dict: with 'songs' as key and the song list as value
         """
-        # get result from database as Peewee model
-        if quantity and score:
-            result = Favorites.select() \
-                .where(Favorites.score > score) \
-                .order_by(fn.Rand()).limit(int(quantity))
-        elif quantity:
-            result = Favorites.select() \
-                .order_by(fn.Rand()).limit(int(quantity))
-        elif score:
-            result = Favorites.select() \
-                .where(Favorites.score > score)
+        song_fields, album_fields, with_album = self._split_song_fields(fields)
+        # get result from database as Peewee model, the albums come from the album cache
+        result = Favorites.select(*[Favorites._meta.fields[name] for name in SONG_FIELDS
+                                    if song_fields is None or name == 'id' or name in song_fields or
+                                    (with_album and name == 'album_id')])
+        if score:
+            result = result.where(Favorites.score > score)
+        headers = {}
+        if quantity:
+            self._sync_sampler(favorites_sampler)
+            song_ids = favorites_sampler.sample(quantity, score or None)
+            rows = self._get_rows_by_ids(result, Favorites.id, song_ids)
+        elif limit:
+            rows, headers = self._get_page(result, Favorites.id, limit, after)
         else:
-            result = Favorites.select()
-        # No, I will not do a JOIN. Some column names are the same in both tables (title for example)
-        # The simple Join query on Peewee will override those names
-        # That means that every column with shared name has to be given an alias and then map back to the
-        # corresponding model. A bit too much effort and not clean. I'm not worried about efficiency here
-        list_result = [song for song in result.dicts() if self._get_album_for_song(song)]
+            rows = list(result.dicts())
+        list_result = self._add_albums_to_songs(rows, album_fields) if with_album else rows
+        if song_fields is not None:
+            list_result = [pick_fields(song, song_fields + ['album']) for song in list_result]
+        if quantity:
+            # keep the random order of the sample
+            list_result = self._sort_by_ids(list_result, song_ids)
         logger.debug('Getting result for get_songs: %s', list_result)
+        if headers:
+            return {'songs': list_result}, 200, headers
         return {'songs': list_result}
 
+    @database_mgmt
+    def get_playlist(self, quantity, score=None, band_spacing=0, album_spacing=0, history=0, continuation=None):
+        """Gets a playlist of favorite songs, drawn with a probability that grows with their score.
+        The songs of the continuation are not repeated and the songs of the same band or album are kept apart.
+        Args:
+            quantity(int): the number of songs of the playlist
+            score(float): if given only songs with a score strictly greater than this one are picked
+            band_spacing(int): the minimum number of songs between two songs of the same band
+            album_spacing(int): the minimum number of songs between two songs of the same album
+            history(int): the number of songs played kept in the continuation token to not repeat them
+            continuation(str): the continuation token of the previous playlist of the client
+        Returns:
+            dict: with the songs of the playlist, with their album, and the continuation token of the next one
+        """
+        try:
+            played = Playlist.decode_history(continuation) if continuation else []
+        except ValueError:
+            return None, 400
+        spacing = max(band_spacing or 0, album_spacing or 0)
+        recent_ids = played[-spacing:] if spacing else []
+        recent_songs = {song_id: (album_id, band) for song_id, album_id, band in
+                        Favorites.select(Favorites.id, Favorites.album_id, Album.band)
+                        .join(Album, on=(Favorites.album_id == Album.id))
+                        .where(Favorites.id.in_(recent_ids)).tuples()} if recent_ids else {}
+        self._sync_sampler(playlist_sampler)
+        song_ids = Playlist.pick_songs(playlist_sampler, quantity, score or None, played,
+                                       [recent_songs[song_id] for song_id in recent_ids if song_id in recent_songs],
+                                       band_spacing, album_spacing)
+        songs = self._get_rows_by_ids(Favorites.select(), Favorites.id, song_ids)
+        songs = self._add_albums_to_songs(self._sort_by_ids(songs, song_ids))
+        played = (played + song_ids)[-history:] if history else []
+        return {'songs': songs, 'continuation': Playlist.encode_history(played)}, 200
+
+    @staticmethod
+    def _split_song_fields(fields):
+        """Splits the fields parameter of the songs in the fields of the song and the fields of its album.
+        Args:
+            fields([str]): the fields of the songs and 'album' or 'album.<field>' for the fields of their album
+        Returns:
+            ([str], [str], bool): the fields of the song, the fields of the album and if the album is included.
+            The fields are None if all of them are included
+        """
+        if fields is None:
+            return None, None, True
+        song_fields = [name for name in fields if name != 'album' and not name.startswith('album.')]
+        album_fields = [name.split('.', 1)[1] for name in fields if name.startswith('album.')]
+        with_album = 'album' in fields or bool(album_fields)
+        return song_fields, None if 'album' in fields else album_fields, with_album
+
+    @staticmethod
+    def _song_to_row(song):
+        """Converts a song to the fields of a row of the favorites table, validating their types.
+        Args:
+            song(dict): the song to convert
+        Raises:
+            KeyError: if a compulsory field is missing
+            ValueError, TypeError: if a field has a wrong value
+        Returns:
+            dict: with the fields of the Favorites model as keys
+        """
+        # first copy compulsory fields and validate types
+        row = {'title': song['title'],
+               'score': float(song['score']),
+               'album_id': int(song['album']['id']),
+               'file_name': song['file_name']}
+        # now copy optional fields
+        if 'track_number' in song:
+            row['track_number'] = int(song['track_number'])
+        if 'type' in song:
+            row['type'] = song['type']
+        return row
+
+    def _get_favorite_ids(self, keys):
+        """Gets the ids of the favorite songs matching the given album ids and titles.
+        Args:
+            keys(set): set of (album_id, title) tuples
+        Returns:
+            dict: with (album_id, title) tuples as keys and the ids of the songs as values
+        """
+        query = Favorites.select(Favorites.id, Favorites.album_id, Favorites.title)
+        album_ids = list({album_id for album_id, _ in keys})
+        return {(row['album_id'], row['title']): row['id']
+                for row in self._get_rows_by_ids(query, Favorites.album_id, album_ids)
+                if (row['album_id'], row['title']) in keys}
+
     @database_mgmt
     def create_song(self, song):
         """Creates a song on the favorites table.
@@ -142,41 +753,36 @@ class DatabaseProvider(object):
             song(dict): the song to add to the table.
         """
         if song:
-            fav = Favorites()
-            # first copy compulsory fields and validate types
             try:
-                fav.title = song['title']
-                fav.score = float(song['score'])
-                fav.album_id = int(song['album']['id'])
-                fav.file_name = song['file_name']
+                row = self._song_to_row(song)
+                if 'id' in song:
+                    # id was provided so it was already on the database. This will update the existing song
+                    row['id'] = int(song['id'])
             except KeyError:
                 logger.exception('Exception on key when creating favorite song')
                 return song, 400
-            except ValueError:
+            except (ValueError, TypeError):
                 logger.exception('Exception on value when creating favorite song')
                 return song, 400
-            # now copy optional fields
-            try:
-                fav.track_number = int(song['track_number'])
-                fav.type = song['type']
-            except KeyError:
-                logger.warning('Type of song was not provided for song: ', song)
-
+            # a song with the same id, or the same album and title or file name, is updated instead of duplicated
+            preserve = [Favorites._meta.fields[field] for field in row if field != 'id']
+            if database.returning_clause:
+                # the insert returns the id of the row inserted or updated
+                query = Favorites.insert(row).on_conflict(preserve=preserve).returning(Favorites.id).tuples()
+            else:
+                # makes the id of the updated row the last insert id
+                query = Favorites.insert(row).on_conflict(
+                    preserve=preserve, update={Favorites.id: fn.LAST_INSERT_ID(Favorites.id)})
             try:
-                # id was provided so it was already on the database. This will update the existing song
-                fav.id = song['id']
-            except KeyError:
-                # Id was not provided search song by title and album_id, perhaps it already exists
-                result = self._search_song_by_title_and_album_id(fav.title, fav.album_id)
-                if result and result[0]:
-                    try:
-                        # id exists add it to the object to save to update the existing one
-                        fav.id = result[0]['id']
-                    except KeyError:
-                        logger.exception('Exception on value when creating favorite song')
-                        return None, 400
-            # save object in database
-            fav.save()
+                with database.atomic():
+                    result = query.execute()
+                    # the id of the row written, which is not the given one if it matched another song by key
+                    song_id = next(iter(result))[0] if database.returning_clause else result
+                    self._data_changed(songs=[song_id])
+            except IntegrityError:
+                logger.exception('Exception on constraints when creating favorite song')
+                return song, 409
+            song['id'] = song_id
             return song, 200
         else:
             return None, 400
@@ -189,6 +795,60 @@ class DatabaseProvider(object):
         """
         return self.create_song(song)
 
+    @database_mgmt
+    def update_songs(self, songs):
+        """Creates or updates a list of songs in the favorites table in a single transaction.
+        Songs without id are matched with the existing ones by album id and title or file name.
+        Args:
+            songs([dict]): the songs to create or update
+        Returns:
+            [dict]: the status of each song in the same order with keys index, status, id and message
+        """
+        statuses = []
+        rows = {}
+        for index, song in enumerate(songs or []):
+            try:
+                row = self._song_to_row(song)
+                if 'id' in song:
+                    row['id'] = int(song['id'])
+            except (KeyError, ValueError, TypeError) as ex:
+                statuses.append({'index': index, 'status': 400, 'message': f'Invalid song: {ex!r}'})
+            else:
+                statuses.append({'index': index, 'status': 200})
+                rows[index] = row
+        # songs of albums not in the database would make the whole transaction fail
+        album_ids = list({row['album_id'] for row in rows.values()})
+        found_album_ids = {row['id'] for row in self._get_rows_by_ids(Album.select(Album.id), Album.id, album_ids)}
+        for index, row in list(rows.items()):
+            if row['album_id'] not in found_album_ids:
+                statuses[index] = {'index': index, 'status': 400, 'message': f"Album {row['album_id']} not found"}
+                del rows[index]
+        if rows:
+            # rows with the same fields are written in the same multi-row statement
+            # updating the existing ones by primary key or by the unique keys of the table
+            groups = {}
+            for row in rows.values():
+                groups.setdefault(tuple(sorted(row)), []).append(row)
+            try:
+                with database.atomic():
+                    for fields, group in groups.items():
+                        preserve = [Favorites._meta.fields[field] for field in fields if field != 'id']
+                        for start in range(0, len(group), IDS_CHUNK_SIZE):
+                            Favorites.insert_many(group[start:start + IDS_CHUNK_SIZE]) \
+                                .on_conflict(preserve=preserve).execute()
+                    # get the ids of the inserted songs
+                    saved_ids = self._get_favorite_ids({(row['album_id'], row['title']) for row in rows.values()})
+                    for index, row in rows.items():
+                        # the title is unique per album, so this is the row written even if it had another id
+                        statuses[index]['id'] = saved_ids.get((row['album_id'], row['title']))
+                    self._data_changed(songs={status['id'] for status in statuses if status.get('id')})
+            except IntegrityError as ex:
+                # a song matching different existing songs by title and by file name can't be written
+                logger.exception('Exception on constraints when updating favorite songs')
+                for index in rows:
+                    statuses[index] = {'index': index, 'status': 409, 'message': f'Conflicting songs: {ex!r}'}
+        return statuses, 200
+
     @database_mgmt
     def delete_song(self, song_id):
         """Deletes a song from the favorites table.
@@ -197,75 +857,160 @@ class DatabaseProvider(object):
         """
         fav = Favorites.get(Favorites.id == song_id)
         try:
-            fav.delete_instance()
+            with database.atomic():
+                fav.delete_instance()
+                self._data_changed(deleted_songs=[fav.id])
         except Exception as ex:
             logger.error('Exception when deleting favorite song: ' + str(ex))
             return song_id, 400
         return song_id, 200
 
     @database_mgmt
-    def get_albums(self, quantity, album_id):
-        """Gets an album from the album id.
+    def get_albums(self, quantity, album_id, limit=None, after=None, filters=None, order_by=None, fields=None):
+        """Gets the albums from the album id or list of album ids.
         If not provided and quantity is given then it will get a random list of albums limited by quantity.
+        Otherwise, if limit is given, it will get a page of albums ordered by id or by order_by.
         Args:
             quantity(int): the number of albums to retrieve
-            album_id(int): the id of the album to retrieve
+            album_id(int or [int]): the id or list of ids of the albums to retrieve
+            limit(int): the maximum number of albums of the page to retrieve
+            after(int): the album id after which the page starts
+            filters(dict): the values of the filters of _filter_albums the albums must match
+            order_by(str): one of ALBUM_ORDER_FIELDS, prefixed with '-' for descending order. Only used without
+                album_id and quantity
+            fields([str]): if given only these fields of ALBUM_FIELDS and the id of the albums are retrieved
         """
-        # TODO: get album list if album_id is a list
+        filters = {name: value for name, value in (filters or {}).items() if value is not None}
         if album_id:
-            result = Album.select().where(Album.id == album_id)
+            album_ids = album_id if isinstance(album_id, list) else [album_id]
+            if filters:
+                query = self._filter_albums(Album.select(Album.id), **filters)
+                matching = {row['id'] for row in self._get_rows_by_ids(query, Album.id, album_ids)}
+                album_ids = [album_id for album_id in album_ids if album_id in matching]
+            albums = self._get_albums_by_ids(album_ids)
+            # keep the order of the ids
+            list_result = [pick_fields(albums[album_id], fields) for album_id in album_ids if album_id in albums]
         elif quantity:
-            result = Album.select().order_by(fn.Rand()).limit(int(quantity))
+            self._sync_sampler(albums_sampler)
+            if filters.keys() - {'min_score', 'max_score'}:
+                album_ids = [album_id for album_id, in self._filter_albums(Album.select(Album.id), **filters).tuples()]
+                album_ids = random.sample(album_ids, min(int(quantity), len(album_ids)))
+            elif filters:
+                # albums without a numeric score (NO_SCORE in the index) never match a score filter
+                album_ids = albums_sampler.sample_range(quantity, filters.get('min_score', -sys.float_info.max),
+                                                        filters.get('max_score'))
+            else:
+                album_ids = albums_sampler.sample(quantity)
+            albums = self._get_albums_by_ids(album_ids)
+            # keep the random order of the sample
+            list_result = [pick_fields(albums[album_id], fields) for album_id in album_ids if album_id in albums]
         else:
-            result = Album.select()
-        if result:
-            list_result = [row for row in result.dicts()]
+            # only the columns requested are read from the database
+            query = self._filter_albums(select_albums(fields), **filters)
+            order_field, descending = None, False
+            if order_by:
+                descending = order_by.startswith('-')
+                order_field = ALBUM_ORDER_FIELDS[order_by.lstrip('-')]
+            if limit:
+                # an empty page is a valid result
+                try:
+                    list_result, headers = self._get_page(query, Album.id, limit, after, order_field, descending)
+                except ValueError:
+                    logger.exception('Exception when getting page of albums')
+                    return after, 400
+                logger.debug('Getting page for get_album: %s', list_result)
+                return list_result, 200, headers
+            if order_field is not None:
+                query = query.order_by(order_field.desc() if descending else order_field.asc(), Album.id)
+            list_result = [row for row in query.dicts()]
+        if list_result or filters:
             logger.debug('Getting result for get_album: %s', list_result)
             return list_result, 200
         else:
             logger.error(f"Could not find album with id {album_id}")
             return album_id, 400
 
+    @staticmethod
+    def _filter_albums(query, band=None, min_year=None, max_year=None, style=None, country=None, type=None,
+                       min_score=None, max_score=None):
+        """Adds the given filters to a query of albums. The ones not given are not applied.
+        Args:
+            query(Select): the query of albums to filter
+            band(str): name of the band of the albums
+            min_year(int): minimum year of the albums, included
+            max_year(int): maximum year of the albums, included
+            style(str): style of the albums
+            country(str): country of the albums
+            type(str): type of the albums
+            min_score(float): minimum score of the albums, included
+            max_score(float): maximum score of the albums, included
+        Returns:
+            Select: the filtered query
+        """
+        for field, value in ((Album.band, band), (Album.style, style), (Album.country, country), (Album.type, type)):
+            if value is not None:
+                query = query.where(field == value)
+        for field, minimum, maximum in ((Album.year, min_year, max_year), (Album.score_value, min_score, max_score)):
+            if minimum is not None:
+                query = query.where(field >= minimum)
+            if maximum is not None:
+                query = query.where(field <= maximum)
+        return query
+
+    @staticmethod
+    def _album_to_row(album):
+        """Converts an album to the fields of a row of the music table, validating their types.
+        Args:
+            album(dict): the album to convert
+        Raises:
+            KeyError: if a compulsory field is missing
+            ValueError, TypeError: if a compulsory field has a wrong value
+        Returns:
+            dict: with the fields of the Album model as keys
+        """
+        # first copy compulsory fields and validate types
+        row = {'band': album['band'],
+               'title': album['title'],
+               'year': int(album['year'])}
+        # now copy optional fields
+        if 'score' in album:
+            try:
+                row['score'] = float(album['score'])
+            except ValueError as ex:
+                logger.warning('Exception on score when creating album %s. %s', album, ex)
+            else:
+                # keep the numeric shadow column in sync
+                row['score_value'] = parse_score(row['score'])
+        for field in ('review', 'type', 'country', 'copy', 'style'):
+            if field in album:
+                row[field] = album[field]
+        # if an update is done we will need the id as well
+        if 'id' in album:
+            row['id'] = int(album['id'])
+        return row
+
     @database_mgmt
     def create_album(self, album) -> str:
         # load the object and convert to album
         # TODO: could we use the next line to convert to object with attributes from json dict?
         # album_entry = json.loads(album, object_hook=lambda d: Namespace(**d))
 
-        album_entry = Album()
-        # first copy compulsory fields and validate types
         try:
-            album_entry.band = album['band']
-            album_entry.title = album['title']
-            album_entry.year = int(album['year'])
+            row = self._album_to_row(album)
         except KeyError:
             logger.exception('Exception on key when creating album.')
             return album, 400
-        except ValueError:
+        except (ValueError, TypeError):
             logger.exception('Exception on value when creating album.')
             return album, 400
-        # now copy optional fields
-        if 'score' in album:
-            try:
-                album_entry.score = float(album['score'])
-            except ValueError as ex:
-                logger.warning('Exception on score when creating album %s. %s', album, ex)
-        if 'review' in album:
-            album_entry.review = album['review']
-        if 'type' in album:
-            album_entry.type = album['type']
-        if 'country' in album:
-            album_entry.country = album['country']
-        if 'copy' in album:
-            album_entry.copy = album['copy']
-        if 'style' in album:
-            album_entry.style = album['style']
-        # if an update is done we will need the id as well
-        if 'id' in album:
-            album_entry.id = album['id']
+        album_entry = Album(**row)
         # save object in database
         logger.debug(f'Saving album {album_entry} in database')
-        if album_entry.save():
+        with database.atomic():
+            saved = album_entry.save()
+            if saved:
+                self._data_changed(albums=[album_entry.id])
+        if saved:
             album['id'] = album_entry.id
             return album, 200
         else:
@@ -277,16 +1022,240 @@ class DatabaseProvider(object):
     def update_album(self, album) -> str:
         return self.create_album(album)
 
+    @database_mgmt
+    def update_albums(self, albums):
+        """Creates or updates a list of albums in the music table in a single transaction.
+        Albums with id update the existing ones, the rest are created.
+        Args:
+            albums([dict]): the albums to create or update
+        Returns:
+            [dict]: the status of each album in the same order with keys index, status, id and message
+        """
+        statuses = []
+        rows = {}
+        for index, album in enumerate(albums or []):
+            try:
+                rows[index] = self._album_to_row(album)
+            except (KeyError, ValueError, TypeError) as ex:
+                statuses.append({'index': index, 'status': 400, 'message': f'Invalid album: {ex!r}'})
+            else:
+                statuses.append({'index': index, 'status': 200, 'id': rows[index].get('id')})
+        if rows:
+            # rows with the same fields are written in the same multi-row statement
+            # updating the existing ones by primary key
+            groups = {}
+            for row in rows.values():
+                groups.setdefault(tuple(sorted(row)), []).append(row)
+            with database.atomic():
+                last_id = Album.select(fn.MAX(Album.id)).scalar() or 0
+                for fields, group in groups.items():
+                    preserve = [Album._meta.fields[field] for field in fields if field != 'id']
+                    for start in range(0, len(group), IDS_CHUNK_SIZE):
+                        Album.insert_many(group[start:start + IDS_CHUNK_SIZE]) \
+                            .on_conflict(preserve=preserve).execute()
+                # get the ids of the inserted albums, matched in insertion order by band, title and year
+                given_ids = [row['id'] for row in rows.values() if 'id' in row]
+                new_ids = {}
+                for row in Album.select(Album.id, Album.band, Album.title, Album.year) \
+                        .where((Album.id > last_id) & Album.id.not_in(given_ids)).order_by(Album.id).dicts():
+                    new_ids.setdefault((row['band'], row['title'], row['year']), []).append(row['id'])
+                for group in groups.values():
+                    for row in group:
+                        if 'id' not in row:
+                            ids = new_ids.get((row['band'], row['title'], row['year']))
+                            row['id'] = ids.pop(0) if ids else None
+                for index, row in rows.items():
+                    statuses[index]['id'] = row['id']
+                self._data_changed(albums=[row['id'] for row in rows.values()])
+        return statuses, 200
+
     @database_mgmt
     def delete_album(self, album_id) -> str:
         album_entry = Album.get(Album.id == album_id)
         try:
-            album_entry.delete_instance()
+            with database.atomic():
+                album_entry.delete_instance()
+                self._data_changed(deleted_albums=[album_entry.id])
         except Exception:
             logger.exception('Exception when deleting album')
             return album_id, 400
         return album_id, 200
 
+    @database_mgmt
+    def export_catalog(self, tables=None, score=None):
+        """Exports the albums and favorite songs as newline-delimited JSON.
+        The rows are read from the database in chunks, so the memory used does not depend on the size of the catalog.
+        Args:
+            tables([str]): the tables to export from EXPORT_TABLES. If not given all of them are exported
+            score(float): minimum score of the songs to export
+        Yields:
+            str: a line with a JSON object with the type of row ('album' or 'song') and the row as data
+        """
+        tables = tables or EXPORT_TABLES
+        if 'albums' in tables:
+            for albums in self._iter_by_chunks(select_albums(), Album.id):
+                for album in albums:
+                    yield json.dumps({'type': 'album', 'data': album}) + '\n'
+        if 'songs' in tables:
+            query = Favorites.select()
+            if score:
+                query = query.where(Favorites.score > score)
+            for songs in self._iter_by_chunks(query, Favorites.id):
+                for song in self._add_albums_to_songs(songs):
+                    yield json.dumps({'type': 'song', 'data': song}) + '\n'
+
+    @database_mgmt
+    def get_changes(self, since):
+        """Gets the albums and favorite songs created, updated or deleted after the given version of the data.
+        Args:
+            since(int): the version of the data the client has
+        Returns:
+            dict: with the current version, the changed albums and songs and the ids of the deleted ones, or the
+                current version and the oldest version accepted with a 410 status if the changes since the given one
+                are not in the log anymore
+        """
+        version = self.get_data_version()
+        oldest_version = version - config.CHANGES_RETENTION_VERSIONS
+        if since < oldest_version:
+            # the client has to get the whole catalog again (like from /music/export) and sync from its version
+            return {'version': version, 'oldest_version': oldest_version}, 410
+        # the last change of each row is the one that counts
+        last_changes = {}
+        query = Change.select(Change.entity, Change.row_id, Change.deleted) \
+            .where((Change.version > since) & (Change.version <= version)).order_by(Change.id)
+        for entity, row_id, deleted in query.tuples():
+            last_changes[(entity, row_id)] = deleted
+        changed = {'album': [], 'song': []}
+        deleted = {'album': [], 'song': []}
+        for (entity, row_id), is_deleted in last_changes.items():
+            (deleted if is_deleted else changed)[entity].append(row_id)
+        songs = self._get_rows_by_ids(Favorites.select(), Favorites.id, changed['song'])
+        result = {'version': version,
+                  'albums': self._get_rows_by_ids(select_albums(), Album.id, changed['album']),
+                  'songs': self._add_albums_to_songs(songs),
+                  'deleted_albums': deleted['album'],
+                  'deleted_songs': deleted['song']}
+        logger.debug('Getting result for get_changes: %s', result)
+        return result
+
+    @staticmethod
+    def _count_by(model, field, key, count_name):
+        """Counts the rows of a table by the values of a field, in the order of the values."""
+        query = model.select(field, fn.COUNT(model.id)).group_by(field).order_by(field)
+        return [{key: value, count_name: count} for value, count in query.tuples()]
+
+    @staticmethod
+    def _count_by_band(model, count_name):
+        """Counts the albums or favorite songs of each band, the band with the most of them first."""
+        count = fn.COUNT(model.id)
+        query = model.select(Album.band, count)
+        if model is Favorites:
+            query = query.join(Album, on=(Favorites.album_id == Album.id))
+        query = query.group_by(Album.band).order_by(count.desc(), Album.band)
+        return [{'band': band, count_name: count} for band, count in query.tuples()]
+
+    @staticmethod
+    def _score_histogram(field, count_name):
+        """Counts the rows by score in buckets of width 1, the rows without score in the bucket None."""
+        buckets = {}
+        # the distinct scores are few, so they are grouped in the database and bucketed here
+        for score, count in field.model.select(field, fn.COUNT(field.model.id)).group_by(field).tuples():
+            bucket = None if score is None else int(math.floor(score))
+            buckets[bucket] = buckets.get(bucket, 0) + count
+        return [{'score': bucket, count_name: buckets[bucket]}
+                for bucket in sorted(buckets, key=lambda bucket: (bucket is not None, bucket))]
+
+    def _compute_stats(self):
+        return {'albums': Album.select().count(),
+                'songs': Favorites.select().count(),
+                'bands': Album.select(fn.COUNT(Album.band.distinct())).scalar() or 0,
+                'albums_by_band': self._count_by_band(Album, 'albums'),
+                'songs_by_band': self._count_by_band(Favorites, 'songs'),
+                'albums_by_year': self._count_by(Album, Album.year, 'year', 'albums'),
+                'albums_by_style': self._count_by(Album, Album.style, 'style', 'albums'),
+                'albums_by_country': self._count_by(Album, Album.country, 'country', 'albums'),
+                'albums_by_type': self._count_by(Album, Album.type, 'type', 'albums'),
+                'album_scores': self._score_histogram(Album.score_value, 'albums'),
+                'song_scores': self._score_histogram(Favorites.score, 'songs')}
+
+    @database_mgmt
+    def get_stats(self, top=None):
+        """Gets statistics of the catalog. They are computed once per data version and shared by all the requests.
+        Args:
+            top(int): if given only the bands with the most albums and favorite songs are counted by band
+        Returns:
+            dict: with the number of albums, songs and bands, the albums and songs by band, the albums by year,
+                style, country and type and the histograms of the scores of albums and songs
+        """
+        version = self.get_data_version()
+        with _stats_lock:
+            stats = _stats_cache['stats'] if _stats_cache['version'] == version else None
+        if stats is None:
+            # the version is read before the counts, so if the data changes meanwhile they are computed again
+            stats = self._compute_stats()
+            with _stats_lock:
+                _stats_cache.update(version=version, stats=stats)
+        result = dict(stats, version=version)
+        if top:
+            result['albums_by_band'] = stats['albums_by_band'][:top]
+            result['songs_by_band'] = stats['songs_by_band'][:top]
+        return result, 200
+
+    @staticmethod
+    def _search_ids(model, fields, index_name, words, limit, offset):
+        """Gets the ids of the rows matching all the given words, the most relevant first.
+        Args:
+            model(Model): the model of the table to search
+            fields([Field]): the fields of the full-text index
+            index_name(str): the name of the full-text index
+            words([str]): the words to search, matching whole words or their beginning
+            limit(int): the maximum number of ids to get
+            offset(int): the number of ids to skip
+        Returns:
+            [int]: the ids of the rows found
+        """
+        if isinstance(database, SqliteDatabase):
+            # the FTS5 table kept in sync with the table by triggers, ranked by bm25
+            cursor = database.execute_sql(
+                'SELECT rowid FROM "{0}" WHERE "{0}" MATCH ? ORDER BY rank LIMIT ? OFFSET ?'.format(index_name),
+                (' '.join('"{}"*'.format(word) for word in words), limit, offset))
+            return [row_id for row_id, in cursor]
+        match = Match(fields, ' '.join('+{}*'.format(word) for word in words), 'IN BOOLEAN MODE')
+        query = model.select(model.id).where(match).order_by(match.desc(), model.id).limit(limit).offset(offset)
+        return [row_id for row_id, in query.tuples()]
+
+    @database_mgmt
+    def search(self, q, tables=None, limit=20, after=0):
+        """Searches the albums by band, title and review and the favorite songs by title with the full-text indexes.
+        Args:
+            q(str): the words to search. All of them have to match, as whole words or as the beginning of a word
+            tables([str]): the tables to search from SEARCH_TABLES. If not given all of them are searched
+            limit(int): the maximum number of albums and of songs to get
+            after(int): the number of results of each table of the previous pages
+        Returns:
+            dict: with the albums and songs found, the most relevant first, and the next page header if there are more
+        """
+        words = SEARCH_WORD.findall(q or '')[:MAX_SEARCH_WORDS]
+        if not words:
+            return None, 400
+        tables = tables or SEARCH_TABLES
+        result = {}
+        more = False
+        # one more row than the page tells if there is a next one
+        if 'albums' in tables:
+            album_ids = self._search_ids(Album, ALBUM_SEARCH_FIELDS, ALBUM_SEARCH_INDEX, words, limit + 1, after)
+            more = len(album_ids) > limit
+            albums = self._get_albums_by_ids(album_ids[:limit])
+            result['albums'] = [albums[album_id] for album_id in album_ids[:limit] if album_id in albums]
+        if 'songs' in tables:
+            song_ids = self._search_ids(Favorites, SONG_SEARCH_FIELDS, SONG_SEARCH_INDEX, words, limit + 1, after)
+            more = more or len(song_ids) > limit
+            songs = self._get_rows_by_ids(Favorites.select(), Favorites.id, song_ids[:limit])
+            result['songs'] = self._add_albums_to_songs(self._sort_by_ids(songs, song_ids))
+        if more:
+            return result, 200, {NEXT_PAGE_HEADER: str(after + limit)}
+        return result, 200
+
     # TODO: implement this in a different way or add behavior (like checking connection to database)
     def get(self):
         return "OK", 200
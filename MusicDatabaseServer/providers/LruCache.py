@@ -0,0 +1,94 @@
+"""
+Bounded in-memory cache evicting the least recently used entries.
+"""
+from collections import OrderedDict
+import threading
+
+
+class LruCache(object):
+    """Thread safe cache of at most max_size entries, with hit and miss counters.
+    It keeps the version of the data it was synced with, so the entries changed since then can be invalidated.
+    """
+
+    def __init__(self, max_size):
+        """
+        Args:
+            max_size(int): the maximum number of entries of the cache
+        """
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        # increased on every invalidation, so entries read before one are not added after it
+        self._generation = 0
+        self.version = None
+
+    def get_generation(self):
+        """Gets the number of invalidations of the cache, to pass to put_many the entries read after getting it."""
+        with self._lock:
+            return self._generation
+
+    def get_many(self, keys):
+        """Gets the entries of the given keys that are in the cache.
+        Args:
+            keys([]): the keys to get
+        Returns:
+            dict: with the keys found and their values
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries, generation=None):
+        """Adds the given entries to the cache, evicting the least recently used ones if it's full.
+        Args:
+            entries(dict): the keys and values to add
+            generation(int): if given, the entries are not added if the cache was invalidated since get_generation
+                returned it, as they may have been read before the change
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            for key, value in entries.items():
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, keys, version=None):
+        """Removes the given keys from the cache.
+        Args:
+            keys([]): the keys to remove
+            version(int): if given, the version of the data the cache is synced with after removing the keys
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+            if version is not None:
+                self.version = version
+
+    def clear(self, version=None):
+        """Removes all the entries of the cache.
+        Args:
+            version(int): the version of the data the cache is synced with after clearing it
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.version = version
+
+    def get_stats(self):
+        """Gets the usage statistics of the cache.
+        Returns:
+            dict: with the hits, misses, evictions and size of the cache
+        """
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), max_size=self._max_size)
@@ -0,0 +1,139 @@
+"""
+Prometheus metrics of the server, exposed in /metrics.
+The request metrics are labelled with the operationId of the api definition and the query metrics with the
+DatabaseProvider method running the query.
+When the server runs with several gunicorn workers PROMETHEUS_MULTIPROC_DIR has to be set to a directory shared by them,
+then /metrics aggregates the metrics of all the workers.
+"""
+import os
+
+import yaml
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, \
+    generate_latest
+from prometheus_client import multiprocess
+from providers import DatabaseProvider
+
+METRICS_PATH = '/metrics'
+UNKNOWN_OPERATION = 'unknown'
+
+_SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+_QUERY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+REQUESTS = Counter('musicdb_requests_total', 'Requests served', ['operation', 'method', 'status'])
+REQUEST_DURATION = Histogram('musicdb_request_duration_seconds', 'Time spent serving the requests', ['operation'])
+REQUEST_SIZE = Histogram('musicdb_request_size_bytes', 'Size of the request bodies', ['operation'],
+                         buckets=_SIZE_BUCKETS)
+RESPONSE_SIZE = Histogram('musicdb_response_size_bytes', 'Size of the response bodies (not streamed)', ['operation'],
+                          buckets=_SIZE_BUCKETS)
+DB_QUERY_DURATION = Histogram('musicdb_db_query_duration_seconds', 'Time spent running database queries',
+                              ['method'], buckets=_QUERY_BUCKETS)
+
+# the pool and the album cache belong to each worker, so their values are added up
+POOL_CONNECTIONS = Gauge('musicdb_db_pool_connections', 'Connections of the database pool', ['state'],
+                         multiprocess_mode='livesum')
+POOL_MAX_CONNECTIONS = Gauge('musicdb_db_pool_max_connections', 'Maximum connections of the database pool',
+                             multiprocess_mode='livesum')
+POOL_WAITS = Gauge('musicdb_db_pool_waits', 'Connections taken from the pool and times they timed out waiting',
+                   ['result'], multiprocess_mode='livesum')
+POOL_WAIT_SECONDS = Gauge('musicdb_db_pool_wait_seconds', 'Total seconds spent waiting for a connection of the pool',
+                          multiprocess_mode='livesum')
+POOL_MAX_WAIT_SECONDS = Gauge('musicdb_db_pool_max_wait_seconds', 'Longest wait for a connection of the pool',
+                              multiprocess_mode='livemax')
+ALBUM_CACHE_LOOKUPS = Gauge('musicdb_album_cache_lookups', 'Lookups of the album cache', ['result'],
+                            multiprocess_mode='livesum')
+ALBUM_CACHE_EVICTIONS = Gauge('musicdb_album_cache_evictions', 'Albums evicted from the album cache',
+                              multiprocess_mode='livesum')
+ALBUM_CACHE_SIZE = Gauge('musicdb_album_cache_size', 'Albums in the album cache', multiprocess_mode='livesum')
+
+
+def _load_operations():
+    """Gets the operationId of each method and path of the api definition."""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'open_api',
+                        'app_definition.yaml')
+    with open(path) as definition:
+        spec = yaml.safe_load(definition)
+    return {(method.upper(), route): operation['operationId']
+            for route, methods in spec.get('paths', {}).items()
+            for method, operation in methods.items() if isinstance(operation, dict) and 'operationId' in operation}
+
+
+OPERATIONS = _load_operations()
+
+
+def get_operation(method, path):
+    """Gets the label of a request.
+    Args:
+        method(str): the HTTP method of the request
+        path(str): the path of the request
+    Returns:
+        str: the operationId of the request or UNKNOWN_OPERATION if it isn't in the api definition
+    """
+    return OPERATIONS.get((method.upper(), path.rstrip('/') or '/'), UNKNOWN_OPERATION)
+
+
+def _observe_query(method, sql, params, seconds):
+    DB_QUERY_DURATION.labels(method or UNKNOWN_OPERATION).observe(seconds)
+
+
+def _update_gauges():
+    pool_stats = DatabaseProvider.get_connection_pool_stats()
+    if pool_stats:
+        POOL_CONNECTIONS.labels('in_use').set(pool_stats['in_use'])
+        POOL_CONNECTIONS.labels('idle').set(pool_stats['idle'])
+        POOL_MAX_CONNECTIONS.set(pool_stats['max_connections'])
+        POOL_WAITS.labels('acquired').set(pool_stats['acquired'])
+        POOL_WAITS.labels('timeout').set(pool_stats['timeouts'])
+        POOL_WAIT_SECONDS.set(pool_stats['wait_seconds_total'])
+        POOL_MAX_WAIT_SECONDS.set(pool_stats['wait_seconds_max'])
+    cache_stats = DatabaseProvider.get_album_cache_stats()
+    ALBUM_CACHE_LOOKUPS.labels('hit').set(cache_stats['hits'])
+    ALBUM_CACHE_LOOKUPS.labels('miss').set(cache_stats['misses'])
+    ALBUM_CACHE_EVICTIONS.set(cache_stats['evictions'])
+    ALBUM_CACHE_SIZE.set(cache_stats['size'])
+
+
+def observe_request(operation, method, status, seconds, request_size=None, response_size=None):
+    """Records a request served.
+    Args:
+        operation(str): the operationId of the request
+        method(str): the HTTP method of the request
+        status(int): the status of the response
+        seconds(float): the time spent serving the request
+        request_size(int): the size of the request body if known
+        response_size(int): the size of the response body if known (streamed responses don't have it)
+    """
+    REQUESTS.labels(operation, method, str(status)).inc()
+    REQUEST_DURATION.labels(operation).observe(seconds)
+    if request_size is not None:
+        REQUEST_SIZE.labels(operation).observe(request_size)
+    if response_size is not None:
+        RESPONSE_SIZE.labels(operation).observe(response_size)
+    _update_gauges()
+
+
+def _is_multiprocess():
+    return 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ
+
+
+def render_metrics():
+    """Gets the current metrics in the Prometheus text format.
+    Returns:
+        (bytes, str): the metrics and their content type
+    """
+    if _is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        _update_gauges()
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Removes the live gauges of a worker that exited (gunicorn child_exit hook)."""
+    if _is_multiprocess():
+        multiprocess.mark_process_dead(pid)
+
+
+# every query run by the server is timed
+DatabaseProvider.query_listeners.append(_observe_query)
@@ -0,0 +1,335 @@
+"""
+Versioned schema migrations of the music database.
+Migrations are applied in the order they are declared and the applied ones are recorded in the schema_migrations table,
+so each one runs only once per database.
+"""
+from contextlib import contextmanager
+import datetime
+import logging
+
+from peewee import MySQLDatabase, SqliteDatabase, CharField, DateTimeField, Model, fn, InternalError, \
+    OperationalError
+from playhouse.migrate import SchemaMigrator
+from providers.DatabaseProvider import database, Album, Favorites, DataVersion, Change, DatabaseProvider, \
+    parse_score, IDS_CHUNK_SIZE, ALBUM_SEARCH_INDEX, ALBUM_SEARCH_FIELDS, SONG_SEARCH_INDEX, SONG_SEARCH_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# name of the lock taken while migrating so several server processes starting at once don't apply the same migration
+MIGRATIONS_LOCK_NAME = 'musicdb_migrations'
+MIGRATIONS_LOCK_TIMEOUT = 300
+
+# errors of MySQL when a table can't be altered in place without locking it, like the MyISAM ones
+ALTER_NOT_SUPPORTED_ERRORS = (1845, 1846)
+
+# number of rows updated at once when backfilling a column
+BACKFILL_CHUNK_SIZE = 1000
+
+# values of a field of a duplicated favorite song replaced by the ones of the other duplicates when merging them.
+# A score or track number 0 is a value given to the song, so it's kept
+EMPTY_VALUES = (None, '')
+
+# (name, function) of every migration in the order they have to be applied
+MIGRATIONS = []
+
+
+def migration(name):
+    """
+        Function decorator registering a migration. The function receives a playhouse SchemaMigrator of the database.
+        Names must be unique and never changed once released, they are the key of the bookkeeping table.
+    """
+
+    def register(func):
+        MIGRATIONS.append((name, func))
+        return func
+
+    return register
+
+
+class AppliedMigration(Model):
+    """Bookkeeping of the migrations applied to the database"""
+    name = CharField(primary_key=True)
+    applied_at = DateTimeField(default=datetime.datetime.utcnow)
+
+    class Meta:
+        database = database
+        table_name = 'schema_migrations'
+
+
+def _find_index(migrator, table, columns=None, name=None):
+    for index in migrator.database.get_indexes(table):
+        if index.name == name or (columns is not None and list(index.columns) == list(columns)):
+            return index
+    return None
+
+
+def add_index(migrator, table, columns, name, unique=False):
+    """Adds an index to a table if it doesn't exist yet (with that name or over the same columns).
+    In MySQL the index is built in place without locking the table, so reads and writes go on while it's created.
+    Tables that can't be altered in place (like the MyISAM ones) are locked while the index is built.
+    A non unique index over the same columns is replaced when a unique one is wanted.
+    Args:
+        migrator(SchemaMigrator): the migrator of the database
+        table(str): name of the table
+        columns([str]): names of the columns of the index
+        name(str): name of the index
+        unique(bool): if the index is a unique constraint
+    """
+    existing = _find_index(migrator, table, columns, name)
+    # a unique index serves the lookups of a non unique one as well
+    if existing is not None and (existing.unique or not unique):
+        logger.info("Index %s already exists in %s", existing.name, table)
+        return
+    if existing is not None and existing.name == name:
+        raise ValueError('Index {} of {} has to be replaced by an index with a different name'.format(name, table))
+    if isinstance(migrator.database, MySQLDatabase):
+        statement = 'ALTER TABLE `{}` ADD {}INDEX `{}` ({})'.format(
+            table, 'UNIQUE ' if unique else '', name, ', '.join('`{}`'.format(column) for column in columns))
+        try:
+            migrator.database.execute_sql(statement + ', ALGORITHM=INPLACE, LOCK=NONE')
+        except (InternalError, OperationalError) as ex:
+            if ex.args[0] not in ALTER_NOT_SUPPORTED_ERRORS:
+                raise
+            logger.warning("Index %s of %s can't be built online, the table is locked meanwhile: %s", name, table,
+                           ex)
+            migrator.database.execute_sql(statement)
+    else:
+        migrator.add_index(table, columns, unique, name=name).run()
+    if existing is not None:
+        migrator.drop_index(table, existing.name).run()
+
+
+def drop_index(migrator, table, name):
+    """Drops an index of a table if it exists.
+    Args:
+        migrator(SchemaMigrator): the migrator of the database
+        table(str): name of the table
+        name(str): name of the index
+    """
+    if _find_index(migrator, table, name=name) is not None:
+        migrator.drop_index(table, name).run()
+
+
+def add_fulltext_index(migrator, model, fields, name):
+    """Adds a full-text index to a table if it doesn't exist yet.
+    In MySQL it's a FULLTEXT index, maintained by MySQL itself. In SQLite it's an FTS5 table with the content of the
+    table, named like the index and kept in sync with it by triggers.
+    Args:
+        migrator(SchemaMigrator): the migrator of the database
+        model(Model): the model of the table
+        fields([Field]): the text fields to index
+        name(str): name of the index
+    """
+    table = model._meta.table_name
+    columns = [field.column_name for field in fields]
+    if isinstance(migrator.database, SqliteDatabase):
+        values = ', '.join('{{0}}."{}"'.format(column) for column in columns)
+        quoted_columns = ', '.join('"{}"'.format(column) for column in columns)
+        row_id = model._meta.primary_key.column_name
+        insert = 'INSERT INTO "{}" (rowid, {}) VALUES ({{0}}."{}", {});'.format(name, quoted_columns, row_id, values)
+        delete = 'INSERT INTO "{0}" ("{0}", rowid, {1}) VALUES (\'delete\', {{0}}."{2}", {3});'.format(
+            name, quoted_columns, row_id, values)
+        statements = [
+            'CREATE VIRTUAL TABLE IF NOT EXISTS "{}" USING fts5({}, content="{}", content_rowid="{}", '
+            'tokenize="unicode61 remove_diacritics 2")'.format(name, quoted_columns, table, row_id),
+            'CREATE TRIGGER IF NOT EXISTS "{0}_insert" AFTER INSERT ON "{1}" BEGIN {2} END'.format(
+                name, table, insert.format('new')),
+            'CREATE TRIGGER IF NOT EXISTS "{0}_delete" AFTER DELETE ON "{1}" BEGIN {2} END'.format(
+                name, table, delete.format('old')),
+            'CREATE TRIGGER IF NOT EXISTS "{0}_update" AFTER UPDATE OF {1} ON "{2}" BEGIN {3} {4} END'.format(
+                name, quoted_columns, table, delete.format('old'), insert.format('new')),
+            # indexes the rows already in the table
+            'INSERT INTO "{0}" ("{0}") VALUES (\'rebuild\')'.format(name)]
+        with migrator.database.atomic():
+            for statement in statements:
+                migrator.database.execute_sql(statement)
+        return
+    if _find_index(migrator, table, name=name) is not None:
+        logger.info("Index %s already exists in %s", name, table)
+        return
+    # the first FULLTEXT index of a table rebuilds it, reads go on but writes wait until it's done
+    migrator.database.execute_sql('ALTER TABLE `{}` ADD FULLTEXT INDEX `{}` ({})'.format(
+        table, name, ', '.join('`{}`'.format(column) for column in columns)))
+
+
+def add_column(migrator, table, field):
+    """Adds a column to a table if it doesn't exist yet.
+    Args:
+        migrator(SchemaMigrator): the migrator of the database
+        table(str): name of the table
+        field(Field): the field of the model of the column to add. It should be nullable to add it online
+    """
+    if field.column_name in {column.name for column in migrator.database.get_columns(table)}:
+        logger.info("Column %s already exists in %s", field.column_name, table)
+        return
+    migrator.add_column(table, field.column_name, field).run()
+
+
+def create_table(migrator, model):
+    """Creates the table of a model if it doesn't exist yet, without any index.
+    The indexes of the model are the current ones, they may need columns or a deduplication of later migrations, so
+    each one is added by the migration introducing it.
+    Args:
+        migrator(SchemaMigrator): the migrator of the database
+        model(Model): the model of the table
+    """
+    if migrator.database.table_exists(model._meta.table_name):
+        logger.info("Table %s already exists", model._meta.table_name)
+        return
+    model._schema.create_table(safe=True)
+
+
+@migration('0001_create_tables')
+def create_tables(migrator):
+    # music and favorites already exist in the databases created before the migrations, so this is a no-op for them
+    for model in (Album, Favorites, DataVersion, Change):
+        create_table(migrator, model)
+    add_index(migrator, Change._meta.table_name, ['version'], 'changes_version')
+    if not DataVersion.select().exists():
+        DataVersion.create(version=0)
+
+
+@migration('0002_add_lookup_indexes')
+def add_lookup_indexes(migrator):
+    # songs of an album by title
+    add_index(migrator, Favorites._meta.table_name, ['disc_id', 'track_title'], 'favorites_disc_id_track_title')
+    # songs over a score
+    add_index(migrator, Favorites._meta.table_name, ['score'], 'favorites_score')
+    # albums matched by band, title and year
+    add_index(migrator, Album._meta.table_name, ['groupName', 'title', 'year'], 'music_groupName_title_year')
+
+
+@migration('0003_add_album_score_value')
+def add_album_score_value(migrator):
+    add_column(migrator, Album._meta.table_name, Album.score_value)
+    add_index(migrator, Album._meta.table_name, [Album.score_value.column_name], 'music_mark_value')
+    # the scores are parsed the same way the server does when writing albums, in short transactions by id ranges
+    last_id = 0
+    while True:
+        rows = list(Album.select(Album.id, Album.score).where(Album.id > last_id)
+                    .order_by(Album.id).limit(BACKFILL_CHUNK_SIZE).tuples())
+        if not rows:
+            break
+        ids_by_value = {}
+        for album_id, score in rows:
+            ids_by_value.setdefault(parse_score(score), []).append(album_id)
+        with migrator.database.atomic():
+            for value, ids in ids_by_value.items():
+                Album.update(score_value=value).where(Album.id.in_(ids)).execute()
+        last_id = rows[-1][0]
+
+
+@migration('0004_add_album_filter_indexes')
+def add_album_filter_indexes(migrator):
+    # band is covered by music_groupName_title_year
+    for field in (Album.year, Album.style, Album.country, Album.type):
+        add_index(migrator, Album._meta.table_name, [field.column_name], 'music_' + field.column_name)
+
+
+def _merge_duplicate_favorites(fields):
+    """Merges the favorite songs with the same values of the given fields into the last one created.
+    The empty fields of the song kept are filled with the values of the most recent duplicate having them.
+    """
+    groups = Favorites.select(*fields).group_by(*fields).having(fn.COUNT(Favorites.id) > 1).tuples()
+    names = {field.name for field in fields}
+    merged_names = [field.name for field in Favorites._meta.sorted_fields
+                    if field is not Favorites.id and field.name not in names]
+    duplicate_ids = []
+    updates = []
+    for values in groups:
+        query = Favorites.select().where(*[field == value for field, value in zip(fields, values)])
+        kept, *duplicates = query.order_by(Favorites.id.desc()).dicts()
+        update = {}
+        for name in merged_names:
+            if kept[name] in EMPTY_VALUES:
+                value = next((song[name] for song in duplicates if song[name] not in EMPTY_VALUES), None)
+                if value is not None:
+                    update[name] = value
+        logger.warning("Merging favorite songs %s into %s: %s", duplicates, kept, update)
+        duplicate_ids.extend(song['id'] for song in duplicates)
+        if update:
+            updates.append((kept['id'], update))
+    if duplicate_ids:
+        logger.info("Merged %s duplicated favorite songs by %s", len(duplicate_ids), [f.name for f in fields])
+        with database.atomic():
+            # the duplicates go first, the values moved to the song kept may be unique
+            for start in range(0, len(duplicate_ids), IDS_CHUNK_SIZE):
+                Favorites.delete().where(Favorites.id.in_(duplicate_ids[start:start + IDS_CHUNK_SIZE])).execute()
+            for song_id, update in updates:
+                Favorites.update(**update).where(Favorites.id == song_id).execute()
+            # the clients syncing with the changes log remove them as well
+            DatabaseProvider._data_changed(songs=[song_id for song_id, _ in updates], deleted_songs=duplicate_ids)
+
+
+@migration('0005_add_favorites_unique_keys')
+def add_favorites_unique_keys(migrator):
+    # songs are written with INSERT ... ON DUPLICATE KEY UPDATE on these keys, so duplicates have to go first
+    _merge_duplicate_favorites([Favorites.album_id, Favorites.title])
+    _merge_duplicate_favorites([Favorites.album_id, Favorites.file_name])
+    # replaces the non unique favorites_disc_id_track_title index
+    add_index(migrator, Favorites._meta.table_name, ['disc_id', 'track_title'], 'favorites_disc_id_track_title_unique',
+              unique=True)
+    add_index(migrator, Favorites._meta.table_name, ['disc_id', 'file_name'], 'favorites_disc_id_file_name_unique',
+              unique=True)
+
+
+@migration('0006_add_search_indexes')
+def add_search_indexes(migrator):
+    add_fulltext_index(migrator, Album, ALBUM_SEARCH_FIELDS, ALBUM_SEARCH_INDEX)
+    add_fulltext_index(migrator, Favorites, SONG_SEARCH_FIELDS, SONG_SEARCH_INDEX)
+
+
+@contextmanager
+def _migrations_lock():
+    if isinstance(database, MySQLDatabase):
+        acquired = database.execute_sql('SELECT GET_LOCK(%s, %s)',
+                                        (MIGRATIONS_LOCK_NAME, MIGRATIONS_LOCK_TIMEOUT)).fetchone()[0]
+        if not acquired:
+            raise RuntimeError('Timed out waiting for the lock of the migrations')
+        try:
+            yield
+        finally:
+            database.execute_sql('SELECT RELEASE_LOCK(%s)', (MIGRATIONS_LOCK_NAME,))
+    else:
+        yield
+
+
+def get_migrations_status():
+    """Gets the migrations and when they were applied.
+    Returns:
+        [(str, datetime)]: list of the names of the migrations in order with the date they were applied or None
+    """
+    with database.connection_context():
+        database.create_tables([AppliedMigration], safe=True)
+        applied = {row.name: row.applied_at for row in AppliedMigration.select()}
+    return [(name, applied.get(name)) for name, _ in MIGRATIONS]
+
+
+def migrate(target=None, fake=False):
+    """Applies the pending migrations in order.
+    Args:
+        target(str): name of the last migration to apply. If not given all the pending ones are applied
+        fake(bool): if True the migrations are only recorded as applied without running them
+    Returns:
+        [str]: the names of the migrations applied
+    """
+    names = [name for name, _ in MIGRATIONS]
+    if target is not None and target not in names:
+        raise ValueError('Unknown migration {}'.format(target))
+    to_apply = MIGRATIONS[:names.index(target) + 1] if target is not None else MIGRATIONS
+    applied_now = []
+    with database.connection_context():
+        with _migrations_lock():
+            database.create_tables([AppliedMigration], safe=True)
+            applied = {name for name, in AppliedMigration.select(AppliedMigration.name).tuples()}
+            migrator = SchemaMigrator.from_database(database)
+            for name, func in to_apply:
+                if name in applied:
+                    continue
+                logger.info("%s migration %s", 'Faking' if fake else 'Applying', name)
+                # DDL statements are not transactional in MySQL, so a failed migration has to be safe to run again
+                if not fake:
+                    func(migrator)
+                AppliedMigration.create(name=name)
+                applied_now.append(name)
+    return applied_now
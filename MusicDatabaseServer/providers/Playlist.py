@@ -0,0 +1,190 @@
+"""
+Playlists of favorite songs drawn with a probability that grows with their score, without repeating the songs played
+recently by the client nor playing songs of the same band or album too close to each other.
+The songs played are kept by the client in a continuation token, so the server doesn't hold any state per client.
+"""
+import base64
+import binascii
+import json
+import random
+import zlib
+
+# draws tried for each song of the playlist before picking it from the songs left grouped by band and album
+DRAWS_PER_SONG = 50
+# maximum size of the history of a continuation token once decompressed. The JSON of the ids of the longest history
+# (1000 songs, see the history parameter of the api) is smaller, so a token inflating to more is not valid
+MAX_HISTORY_BYTES = 32 * 1024
+
+
+def encode_history(song_ids):
+    """Gets the continuation token of a playlist.
+    Args:
+        song_ids([int]): the ids of the songs played, the most recent last
+    Returns:
+        str: the ids compressed, safe to use in a URL
+    """
+    data = zlib.compress(json.dumps(song_ids, separators=(',', ':')).encode())
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_history(token):
+    """Gets the songs played from the continuation token of a playlist.
+    Args:
+        token(str): the token got from encode_history
+    Returns:
+        [int]: the ids of the songs played, the most recent last
+    Raises:
+        ValueError: if the token is not valid
+    """
+    try:
+        decompressor = zlib.decompressobj()
+        # the token comes from the client, so it's not inflated past the size of a valid one
+        data = decompressor.decompress(base64.urlsafe_b64decode(token.encode()), MAX_HISTORY_BYTES)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError('Invalid continuation token')
+        song_ids = json.loads(data)
+    except (binascii.Error, zlib.error, UnicodeDecodeError) as error:
+        raise ValueError('Invalid continuation token') from error
+    if not isinstance(song_ids, list) or not all(type(song_id) is int for song_id in song_ids):
+        raise ValueError('Invalid continuation token')
+    return song_ids
+
+
+def _weighted_choice(weights):
+    """Picks a key of a dict with a probability proportional to its value."""
+    return random.choices(list(weights), weights=list(weights.values()))[0]
+
+
+class _Candidates(object):
+    """The songs left to pick, grouped by band and album with the total weight of each group.
+    A song keeping the spacing is picked in O(bands + albums of the band + songs of the album) instead of going
+    through all the songs, and picking it removes it in O(1).
+    """
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows([(int, float, (int, str))]): the id, weight and (album id, band) of the songs
+        """
+        # band -> album id -> [(song id, weight)]
+        self._songs = {}
+        self._band_weights = {}
+        # band -> album id -> weight
+        self._album_weights = {}
+        # song id -> (band, album id, position in the list of the album)
+        self._positions = {}
+        for song_id, weight, (album_id, band) in rows:
+            if weight <= 0:
+                continue
+            songs = self._songs.setdefault(band, {}).setdefault(album_id, [])
+            self._positions[song_id] = (band, album_id, len(songs))
+            songs.append((song_id, weight))
+            self._band_weights[band] = self._band_weights.get(band, 0) + weight
+            album_weights = self._album_weights.setdefault(band, {})
+            album_weights[album_id] = album_weights.get(album_id, 0) + weight
+
+    def __len__(self):
+        return len(self._positions)
+
+    def remove(self, song_id):
+        """Removes a song if it's a candidate."""
+        if song_id not in self._positions:
+            return
+        band, album_id, position = self._positions.pop(song_id)
+        songs = self._songs[band][album_id]
+        _, weight = songs[position]
+        # the last song of the album takes its place
+        last = songs.pop()
+        if position < len(songs):
+            songs[position] = last
+            self._positions[last[0]] = (band, album_id, position)
+        if songs:
+            self._album_weights[band][album_id] -= weight
+            self._band_weights[band] -= weight
+        else:
+            del self._songs[band][album_id]
+            del self._album_weights[band][album_id]
+            if self._songs[band]:
+                self._band_weights[band] -= weight
+            else:
+                del self._songs[band]
+                del self._album_weights[band]
+                del self._band_weights[band]
+
+    def pick(self, recent_bands, recent_albums):
+        """Picks and removes a song by weight, of a band not in recent_bands and an album not in recent_albums.
+        If there is none the band spacing is relaxed first and then the album one.
+        Returns:
+            (int, (int, str)): the id and (album id, band) of the song, or None if there are no candidates
+        """
+        for avoided_bands, avoided_albums in ((recent_bands, recent_albums), ((), recent_albums), ((), ())):
+            bands = {band: weight for band, weight in self._band_weights.items() if band not in avoided_bands}
+            while bands:
+                band = _weighted_choice(bands)
+                albums = {album_id: weight for album_id, weight in self._album_weights[band].items()
+                          if album_id not in avoided_albums}
+                if albums:
+                    album_id = _weighted_choice(albums)
+                    songs = self._songs[band][album_id]
+                    song_id, _ = random.choices(songs, weights=[weight for _, weight in songs])[0]
+                    self.remove(song_id)
+                    return song_id, (album_id, band)
+                # all the albums of the band were played recently
+                del bands[band]
+        return None
+
+
+def _is_spaced(recent, data, band_spacing, album_spacing):
+    album_id, band = data
+    return (not band_spacing or all(band != recent_band for _, recent_band in recent[-band_spacing:])) and \
+        (not album_spacing or all(album_id != recent_album_id for recent_album_id, _ in recent[-album_spacing:]))
+
+
+def pick_songs(sampler, quantity, min_score, history, recent, band_spacing, album_spacing):
+    """Picks the songs of a playlist.
+    The songs are drawn from the sampler by weight until one is not in the history and is far enough from the songs of
+    the same band and album. If that takes too long because few songs are left, the song is picked from the songs
+    left grouped by band and album, built once, relaxing the spacing if no song keeps it. Once all of them were
+    played the history starts again.
+    Args:
+        sampler(RandomSampler): weighted sampler of the favorite songs with (album_id, band) as data of the rows
+        quantity(int): the number of songs to pick
+        min_score(float): if given only songs with a score strictly greater than this one are picked
+        history([int]): the ids of the songs played before, which are not picked again
+        recent([(int, str)]): the album id and band of the last songs played, the most recent last
+        band_spacing(int): the minimum number of songs between two songs of the same band
+        album_spacing(int): the minimum number of songs between two songs of the same album
+    Returns:
+        [int]: the ids of the songs picked, in the order to play them
+    """
+    excluded = set(history)
+    recent = list(recent)
+    picked = []
+    candidates = None
+    draws = sampler.weighted_draws(min_score)
+    while len(picked) < quantity:
+        song_id = None
+        for _, (drawn_id, data) in zip(range(DRAWS_PER_SONG), draws):
+            if drawn_id not in excluded and _is_spaced(recent, data, band_spacing, album_spacing):
+                song_id = drawn_id
+                break
+        if song_id is None:
+            if candidates is None:
+                candidates = _Candidates(row for row in sampler.rows(min_score) if row[0] not in excluded)
+            if not candidates:
+                if len(excluded) == len(picked):
+                    # there are no songs, or all of them are already in the playlist
+                    break
+                # all the songs were played recently, only the ones of this playlist are left out
+                excluded = set(picked)
+                candidates = _Candidates(row for row in sampler.rows(min_score) if row[0] not in excluded)
+                continue
+            song_id, data = candidates.pick({band for _, band in recent[-band_spacing:]} if band_spacing else (),
+                                            {album_id for album_id, _ in recent[-album_spacing:]}
+                                            if album_spacing else ())
+        elif candidates is not None:
+            candidates.remove(song_id)
+        picked.append(song_id)
+        excluded.add(song_id)
+        recent.append(data)
+    return picked
@@ -0,0 +1,75 @@
+"""
+Opt-in tracing of the database queries (DATABASE_QUERY_TRACE_ENABLED).
+Every query is recorded with its duration and the DatabaseProvider method running it in the trace of the request.
+Slow queries are logged, and so are the requests running too many queries (N+1 patterns) or taking too long, with
+all their queries. The queries and the database time of each request are reported in the QUERY_TRACE_HEADER.
+"""
+import contextvars
+import logging
+
+from config import config
+from providers import DatabaseProvider
+
+logger = logging.getLogger(__name__)
+
+QUERY_TRACE_HEADER = 'X-Query-Trace'
+
+# trace of the request being served. A context variable so it follows the request to the threads running its queries
+_current_trace = contextvars.ContextVar('query_trace', default=None)
+
+
+class QueryTrace(object):
+    """Queries run while serving a request."""
+
+    def __init__(self):
+        # (method, sql, params, seconds) of each query
+        self.queries = []
+
+    @property
+    def seconds(self):
+        return sum(query[3] for query in self.queries)
+
+    def to_header(self):
+        """Gets the value of the QUERY_TRACE_HEADER with the number of queries and the milliseconds they took."""
+        return 'queries={}; db_ms={:.2f}'.format(len(self.queries), self.seconds * 1000)
+
+
+def _record_query(method, sql, params, seconds):
+    if seconds >= config.DATABASE_SLOW_QUERY_SECONDS:
+        logger.warning('Slow query of %s (%.3f s): %s %s', method, seconds, sql, params)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.queries.append((method, sql, params, seconds))
+
+
+def start_trace():
+    """Starts tracing the queries of a request.
+    Returns:
+        Token: to pass to stop_trace, or None if tracing is not enabled
+    """
+    if not config.DATABASE_QUERY_TRACE_ENABLED:
+        return None
+    return _current_trace.set(QueryTrace())
+
+
+def stop_trace(token, request_description, seconds):
+    """Stops tracing the queries of a request, logging it if it ran too many queries or took too long.
+    Args:
+        token(Token): the token returned by start_trace
+        request_description(str): the method and path of the request, for the log
+        seconds(float): the time spent serving the request
+    Returns:
+        QueryTrace: the queries of the request
+    """
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if len(trace.queries) > config.DATABASE_SLOW_REQUEST_QUERIES or seconds >= config.DATABASE_SLOW_REQUEST_SECONDS:
+        logger.warning('Slow request %s (%.3f s) ran %s queries in %.3f s:\n%s', request_description, seconds,
+                       len(trace.queries), trace.seconds,
+                       '\n'.join('  {} {:.4f} s: {} {}'.format(method, query_seconds, sql, params)
+                                 for method, sql, params, query_seconds in trace.queries))
+    return trace
+
+
+if config.DATABASE_QUERY_TRACE_ENABLED:
+    DatabaseProvider.query_listeners.append(_record_query)
@@ -0,0 +1,128 @@
+"""
+In-memory index of table ids used to pick random rows without sorting the whole table in the database.
+"""
+from collections import namedtuple
+import bisect
+import itertools
+import random
+import threading
+
+# ids sorted by score, the scores, the data of the rows and the cumulative weights of the rows
+_Index = namedtuple('_Index', ['ids', 'scores', 'data', 'cumulative_weights'])
+
+
+class RandomSampler(object):
+    """Keeps the ids of a table sorted by score so a random sample over a minimum score costs O(quantity).
+    With a weight function it keeps the cumulative weights of the rows as well, so a draw weighted by score costs
+    O(log n).
+    The index is loaded lazily and reloaded after an invalidation (on writes of this process) or when it's synced with
+    a new version of the data, so writes done by other processes are picked up as well.
+    """
+
+    def __init__(self, loader, weight=None):
+        """
+        Args:
+            loader(callable): returns an iterable of (id, score) tuples with all the rows of the table. The tuples may
+                have more values, the data of the row given along with the id by weighted_draws and rows
+            weight(callable): gets the weight of a row from its score, needed for weighted_draws and rows
+        """
+        self._loader = loader
+        self._weight = weight
+        self._lock = threading.Lock()
+        self._index = _Index([], [], [], [])
+        # increased on every invalidation, the index is valid if it was loaded in the current generation
+        self._generation = 0
+        self._loaded_generation = None
+        self._version = None
+
+    def invalidate(self):
+        """Marks the index to be reloaded on the next sample."""
+        with self._lock:
+            self._generation += 1
+
+    def sync(self, version):
+        """Marks the index to be reloaded on the next sample if it was loaded for another version of the data.
+        Args:
+            version(int): the current version of the data
+        """
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._generation += 1
+
+    def _get_index(self):
+        with self._lock:
+            if self._loaded_generation == self._generation:
+                return self._index
+            generation = self._generation
+        # the whole table is read without holding the lock, so the samples with a valid index don't wait for it
+        rows = sorted(self._loader(), key=lambda row: row[1])
+        scores = [row[1] for row in rows]
+        cumulative_weights = list(itertools.accumulate(self._weight(score) for score in scores)) \
+            if self._weight else []
+        index = _Index([row[0] for row in rows], scores, [row[2:] for row in rows], cumulative_weights)
+        with self._lock:
+            # an index loaded meanwhile from a later generation is not replaced
+            if self._loaded_generation is None or generation >= self._loaded_generation:
+                self._index = index
+                self._loaded_generation = generation
+        return index
+
+    def sample(self, quantity, min_score=None):
+        """Gets random ids from the index.
+        Args:
+            quantity(int): the number of ids to get
+            min_score(float): if given only ids with a score strictly greater than this one are picked
+        Returns:
+            [int]: list of random ids, without repetitions, in random order
+        """
+        ids, scores = self._get_index()[:2]
+        start = bisect.bisect_right(scores, min_score) if min_score is not None else 0
+        quantity = max(0, min(int(quantity), len(ids) - start))
+        return [ids[index] for index in random.sample(range(start, len(ids)), quantity)]
+
+    def sample_range(self, quantity, min_score=None, max_score=None):
+        """Gets random ids from the index with a score in the given range.
+        Args:
+            quantity(int): the number of ids to get
+            min_score(float): if given only ids with a score greater than or equal to this one are picked
+            max_score(float): if given only ids with a score lower than or equal to this one are picked
+        Returns:
+            [int]: list of random ids, without repetitions, in random order
+        """
+        ids, scores = self._get_index()[:2]
+        start = bisect.bisect_left(scores, min_score) if min_score is not None else 0
+        end = bisect.bisect_right(scores, max_score) if max_score is not None else len(ids)
+        quantity = max(0, min(int(quantity), end - start))
+        return [ids[index] for index in random.sample(range(start, end), quantity)]
+
+    def weighted_draws(self, min_score=None):
+        """Draws random ids from the index, each one with a probability proportional to its weight.
+        The draws are independent, so the same id can come out again. Nothing is drawn if no id is over min_score.
+        Args:
+            min_score(float): if given only ids with a score strictly greater than this one are drawn
+        Yields:
+            (int, tuple): the id and the data of the row drawn
+        """
+        index = self._get_index()
+        start = bisect.bisect_right(index.scores, min_score) if min_score is not None else 0
+        if start >= len(index.ids):
+            return
+        low = index.cumulative_weights[start - 1] if start else 0
+        high = index.cumulative_weights[-1]
+        last = len(index.ids) - 1
+        while True:
+            position = bisect.bisect_right(index.cumulative_weights, random.uniform(low, high), start)
+            yield index.ids[min(position, last)], index.data[min(position, last)]
+
+    def rows(self, min_score=None):
+        """Gets all the ids of the index over a score with their weight and data.
+        Args:
+            min_score(float): if given only ids with a score strictly greater than this one are returned
+        Returns:
+            [(int, float, tuple)]: the id, weight and data of each row
+        """
+        index = self._get_index()
+        start = bisect.bisect_right(index.scores, min_score) if min_score is not None else 0
+        return [(index.ids[position], self._weight(index.scores[position]), index.data[position])
+                for position in range(start, len(index.ids))]
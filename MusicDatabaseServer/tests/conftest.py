@@ -0,0 +1,86 @@
+"""
+Fixtures of the tests of the server.
+They run against an embedded SQLite database in a temporary directory. With MUSICDB_TEST_MYSQL=true they run against
+the MySQL database of the DATABASE_* variables instead, and ALL ITS TABLES ARE DROPPED before each test.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ.setdefault('APP_PORT', '2020')
+# the tests apply the migrations to each new database themselves
+os.environ['DATABASE_MIGRATE_ON_START'] = 'false'
+if os.environ.get('MUSICDB_TEST_MYSQL', 'false').lower() == 'true':
+    os.environ['DATABASE_BACKEND'] = 'mysql'
+else:
+    os.environ['DATABASE_BACKEND'] = 'sqlite'
+    os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='musicdb_tests_'), 'musicdb.sqlite')
+
+from peewee import SqliteDatabase
+from app import create_app
+from providers import DatabaseProvider
+from providers.DatabaseProvider import database
+from providers.Migrations import migrate
+
+
+def _drop_all_tables():
+    DatabaseProvider.close_all_connections()
+    if isinstance(database, SqliteDatabase):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database.database + suffix):
+                os.remove(database.database + suffix)
+        return
+    with database.connection_context():
+        database.execute_sql('SET FOREIGN_KEY_CHECKS = 0')
+        try:
+            for table in database.get_tables():
+                database.execute_sql('DROP TABLE `{}`'.format(table))
+        finally:
+            database.execute_sql('SET FOREIGN_KEY_CHECKS = 1')
+
+
+def _reset_caches():
+    DatabaseProvider.album_cache.clear()
+    for sampler in (DatabaseProvider.favorites_sampler, DatabaseProvider.albums_sampler,
+                    DatabaseProvider.playlist_sampler):
+        sampler.invalidate()
+    DatabaseProvider._stats_cache.update(version=None, stats=None)
+
+
+@pytest.fixture
+def empty_database():
+    """The database without any table and the caches of the server empty."""
+    _drop_all_tables()
+    _reset_caches()
+    yield database
+    DatabaseProvider.close_all_connections()
+
+
+@pytest.fixture
+def provider(empty_database):
+    """A DatabaseProvider of a new database with all the migrations applied."""
+    migrate()
+    return DatabaseProvider.DatabaseProvider()
+
+
+@pytest.fixture
+def album_id(provider):
+    """The id of an album of the database."""
+    album, _ = provider.create_album({'band': 'Band', 'title': 'Album', 'year': '1990', 'style': 'Jazz',
+                                      'country': 'Norway', 'type': 'LP', 'score': '8'})
+    return album['id']
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    """The Flask app of the server, created once for all the tests."""
+    return create_app().app
+
+
+@pytest.fixture
+def client(flask_app, provider):
+    """A test client of the Flask app serving a new database with all the migrations applied."""
+    return flask_app.test_client()
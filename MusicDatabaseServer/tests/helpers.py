@@ -0,0 +1,88 @@
+"""
+Helpers shared by the tests.
+"""
+import threading
+
+from peewee import SqliteDatabase
+from providers.DatabaseProvider import Album, Favorites, database
+
+# music and favorites tables as they were created before the migrations
+LEGACY_TABLES = {
+    'sqlite': ['CREATE TABLE music (Id INTEGER PRIMARY KEY AUTOINCREMENT, groupName VARCHAR(256), copy VARCHAR(256), '
+               'loc VARCHAR(256), mark VARCHAR(256), review TEXT, style VARCHAR(256), title VARCHAR(256), '
+               'type VARCHAR(256), year INTEGER)',
+               'CREATE TABLE favorites (Id INTEGER PRIMARY KEY AUTOINCREMENT, '
+               'disc_id INTEGER NOT NULL REFERENCES music (Id), score FLOAT, track_no INTEGER, '
+               'track_title VARCHAR(256), file_name VARCHAR(256), type VARCHAR(256))'],
+    'mysql': ['CREATE TABLE music (Id INT NOT NULL AUTO_INCREMENT, groupName VARCHAR(256), copy VARCHAR(256), '
+              'loc VARCHAR(256), mark VARCHAR(256), review TEXT, style VARCHAR(256), title VARCHAR(256), '
+              'type VARCHAR(256), year INT, PRIMARY KEY (Id))',
+              'CREATE TABLE favorites (Id INT NOT NULL AUTO_INCREMENT, disc_id INT NOT NULL, score FLOAT, '
+              'track_no INT, track_title VARCHAR(256), file_name VARCHAR(256), type VARCHAR(256), PRIMARY KEY (Id), '
+              'FOREIGN KEY (disc_id) REFERENCES music (Id))'],
+}
+
+
+def create_legacy_tables():
+    """Creates the legacy tables with two albums, the first one with a favorite song.
+    Returns:
+        (int, int): the ids of the albums
+    """
+    backend = 'sqlite' if isinstance(database, SqliteDatabase) else 'mysql'
+    with database.connection_context():
+        for statement in LEGACY_TABLES[backend]:
+            database.execute_sql(statement)
+        # only the columns of the legacy tables are inserted
+        first = Album.insert(band='Band', title='Album', year=1990, score='7.5', copy='', country='', review='',
+                             style='', type='').execute()
+        second = Album.insert(band='Band', title='Other', year=1991, score='?', copy='', country='', review='',
+                              style='', type='').execute()
+        Favorites.insert(album_id=first, title='Song', file_name='song.mp3', score=4, track_number=2,
+                         type='mp3').execute()
+    return first, second
+
+
+def song(album_id, title, file_name, score=3, song_id=None):
+    """Gets a favorite song as sent to the API."""
+    result = {'title': title, 'file_name': file_name, 'score': str(score), 'track_number': '1', 'type': 'mp3',
+              'album': {'id': str(album_id)}}
+    if song_id is not None:
+        result['id'] = str(song_id)
+    return result
+
+
+def titles(result):
+    """Gets the titles of the songs of a result of the provider."""
+    return {song['title'] for song in result['songs']}
+
+
+def write_until_commit(write):
+    """Runs write in a transaction of another thread, stopping before the commit.
+    Returns:
+        function: commits the transaction and waits for the thread to end
+    """
+    written = threading.Event()
+    commit = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            with database.connection_context():
+                with database.atomic():
+                    write()
+                    written.set()
+                    commit.wait(10)
+        except Exception as ex:
+            errors.append(ex)
+            written.set()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    written.wait(10)
+
+    def finish():
+        commit.set()
+        thread.join(10)
+        assert not errors
+
+    return finish
@@ -0,0 +1,36 @@
+from providers import DatabaseProvider as database_provider
+from providers.DatabaseProvider import DatabaseProvider, Album, Change, DataVersion, database
+
+from helpers import song, write_until_commit
+
+
+def _bands(provider):
+    return [song['album']['band'] for song in provider.get_songs()['songs']]
+
+
+def test_songs_get_an_album_updated_while_it_was_cached(provider, album_id):
+    provider.create_song(song(album_id, 'Song', 'song.mp3'))
+
+    def write():
+        Album.update(band='New band').where(Album.id == album_id).execute()
+        DatabaseProvider._data_changed(albums=[album_id])
+
+    commit = write_until_commit(write)
+    # the album cache is filled while the album is not committed yet
+    assert _bands(provider) == ['Band']
+    commit()
+    assert _bands(provider) == ['New band']
+
+
+def test_songs_get_an_album_updated_by_another_process(provider, album_id):
+    provider.create_song(song(album_id, 'Song', 'song.mp3'))
+    assert _bands(provider) == ['Band']
+    assert database_provider.get_album_cache_stats()['size'] == 1
+    # written without invalidating the album cache of this process
+    with database.connection_context():
+        with database.atomic():
+            Album.update(band='New band').where(Album.id == album_id).execute()
+            DataVersion.update(version=DataVersion.version + 1).execute()
+            version = DataVersion.select(DataVersion.version).scalar()
+            Change.create(version=version, entity='album', row_id=album_id)
+    assert _bands(provider) == ['New band']
@@ -0,0 +1,96 @@
+def _album(band, title, year, **fields):
+    return dict({'band': band, 'title': title, 'year': str(year)}, **fields)
+
+
+def test_update_albums_batch_returns_the_status_of_each_album(client, album_id):
+    response = client.put('/music/albums/batch', json=[_album('New', 'First', 2000),
+                                                       {'band': 'No year', 'title': 'Invalid'},
+                                                       _album('Band', 'Renamed', 1990, id=str(album_id)),
+                                                       _album('New', 'First', 2000)])
+    assert response.status_code == 200
+    statuses = response.json
+    assert [status['index'] for status in statuses] == [0, 1, 2, 3]
+    assert [status['status'] for status in statuses] == [200, 400, 200, 200]
+    assert statuses[2]['id'] == album_id
+    # albums with the same band, title and year get an id each
+    assert len({statuses[0]['id'], statuses[3]['id'], album_id}) == 3
+    albums = {album['id']: album['title'] for album in client.get('/music/albums').json}
+    assert albums == {album_id: 'Renamed', statuses[0]['id']: 'First', statuses[3]['id']: 'First'}
+
+
+def _pages(client, path):
+    """Gets all the pages of a paginated path following the X-Next-After header."""
+    pages = []
+    response = client.get(path)
+    while True:
+        assert response.status_code == 200
+        pages.append(response.json)
+        if 'X-Next-After' not in response.headers:
+            return pages
+        response = client.get('{}&after={}'.format(path, response.headers['X-Next-After']))
+
+
+def test_get_albums_by_pages(client):
+    album_ids = [client.post('/music/albums', json=_album('Band', 'Album {}'.format(index), 2000)).json['id']
+                 for index in range(5)]
+    pages = _pages(client, '/music/albums?limit=2')
+    assert [[album['id'] for album in page] for page in pages] == [album_ids[:2], album_ids[2:4], album_ids[4:]]
+
+
+def _create_albums(client, *albums):
+    return [client.post('/music/albums', json=album).json['id'] for album in albums]
+
+
+def _ids(response):
+    assert response.status_code == 200
+    return [album['id'] for album in response.json]
+
+
+def test_get_albums_by_score(client):
+    low, high, unscored = _create_albums(client, _album('Band', 'Low', 2000, score='3'),
+                                         _album('Band', 'High', 2001, score='7.5'),
+                                         _album('Band', 'Unscored', 2002, score='?'))
+    assert _ids(client.get('/music/albums?min_score=5')) == [high]
+    assert _ids(client.get('/music/albums?min_score=3&max_score=7')) == [low]
+    # the random albums use the same filters, the albums without a numeric score never match them
+    assert sorted(_ids(client.get('/music/albums?quantity=10&min_score=0'))) == [low, high]
+    assert sorted(_ids(client.get('/music/albums?quantity=10'))) == [low, high, unscored]
+
+
+def test_get_albums_filtered(client):
+    first, second, third = _create_albums(
+        client, _album('Band', 'First', 1990, style='Jazz', country='Norway', type='LP'),
+        _album('Band', 'Second', 2000, style='Rock', country='Norway', type='LP'),
+        _album('Other', 'Third', 2010, style='Jazz', country='Sweden', type='EP'))
+    assert _ids(client.get('/music/albums?band=Band')) == [first, second]
+    assert _ids(client.get('/music/albums?min_year=2000')) == [second, third]
+    assert _ids(client.get('/music/albums?min_year=1995&max_year=2005')) == [second]
+    assert _ids(client.get('/music/albums?style=Jazz&country=Norway')) == [first]
+    assert _ids(client.get('/music/albums?type=EP')) == [third]
+    # the albums of a list of ids are filtered as well
+    assert _ids(client.get('/music/albums?album_id={},{}&style=Jazz'.format(third, second))) == [third]
+    assert _ids(client.get('/music/albums?band=Nobody')) == []
+
+
+def test_get_albums_sorted(client):
+    first, second, third, fourth = _create_albums(client, _album('B', 'First', 2000, score='5'),
+                                                  _album('A', 'Second', 1990, score='9'),
+                                                  _album('C', 'Third', 2000),
+                                                  _album('A', 'Fourth', 2010, score='1'))
+    assert _ids(client.get('/music/albums?order_by=band')) == [second, fourth, first, third]
+    assert _ids(client.get('/music/albums?order_by=-year')) == [fourth, first, third, second]
+    # the albums without score first in ascending order, like MySQL does
+    assert _ids(client.get('/music/albums?order_by=score')) == [third, fourth, first, second]
+    # the pages keep the order
+    pages = _pages(client, '/music/albums?order_by=-score&limit=1')
+    assert [album['id'] for page in pages for album in page] == [second, first, fourth, third]
+    pages = _pages(client, '/music/albums?order_by=year&min_year=2000&limit=2')
+    assert [[album['id'] for album in page] for page in pages] == [[first, third], [fourth]]
+
+
+def test_get_albums_with_fields(client, album_id):
+    assert client.get('/music/albums?fields=title,year').json == [{'id': album_id, 'title': 'Album', 'year': 1990}]
+    assert client.get('/music/albums?album_id={}&fields=band'.format(album_id)).json == [{'id': album_id,
+                                                                                          'band': 'Band'}]
+    assert set(client.get('/music/albums?quantity=1&fields=review').json[0]) == {'id', 'review'}
+    assert client.get('/music/albums?fields=unknown').status_code == 400
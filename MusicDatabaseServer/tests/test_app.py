@@ -0,0 +1,68 @@
+import pytest
+
+from config import config
+from providers import DatabaseProvider, Metrics, QueryTrace
+from providers.DatabaseProvider import database
+from providers.Metrics import METRICS_PATH
+
+
+@pytest.fixture
+def connections_opened(monkeypatch):
+    """Counts the database connections opened (or taken from the pool)."""
+    opened = []
+    connect = database.connect
+
+    def counting_connect(*args, **kwargs):
+        result = connect(*args, **kwargs)
+        if result:
+            opened.append(result)
+        return result
+
+    monkeypatch.setattr(database, 'connect', counting_connect)
+    return opened
+
+
+@pytest.mark.parametrize('method, path, headers', [
+    ('GET', METRICS_PATH, {}),
+    ('GET', '/', {}),
+    ('OPTIONS', '/music/albums', {'Origin': 'http://player', 'Access-Control-Request-Method': 'GET'}),
+])
+def test_requests_not_using_the_database_take_no_connection(client, connections_opened, method, path, headers):
+    response = client.open(path, method=method, headers=headers)
+    assert response.status_code == 200
+    assert connections_opened == []
+
+
+def test_a_request_uses_a_single_connection(client, album_id, connections_opened):
+    client.post('/music/fav_songs', json={'title': 'Song', 'score': '3', 'file_name': 'song.mp3',
+                                          'album': {'id': str(album_id)}})
+    response = client.get('/music/fav_songs')
+    assert response.status_code == 200
+    assert [song['title'] for song in response.json['songs']] == ['Song']
+    # one for each request, given back when the request ends
+    assert len(connections_opened) == 2
+    assert database.is_closed()
+
+
+def test_streamed_requests_are_recorded_when_their_body_ends(client, album_id, monkeypatch):
+    observed = []
+    traces = []
+    monkeypatch.setattr(Metrics, 'observe_request', lambda *args: observed.append(args))
+    monkeypatch.setattr(config, 'DATABASE_QUERY_TRACE_ENABLED', True)
+    monkeypatch.setattr(DatabaseProvider, 'query_listeners',
+                        DatabaseProvider.query_listeners + [QueryTrace._record_query])
+    stop_trace = QueryTrace.stop_trace
+    monkeypatch.setattr(QueryTrace, 'stop_trace', lambda *args: traces.append(stop_trace(*args)))
+    client.post('/music/fav_songs', json={'title': 'Song', 'score': '3', 'file_name': 'song.mp3',
+                                          'album': {'id': str(album_id)}})
+    observed.clear()
+    traces.clear()
+    response = client.get('/music/export')
+    assert observed == [] and traces == []
+    assert len(response.get_data(as_text=True).splitlines()) == 2
+    response.close()
+    assert [(operation, status) for operation, _, status, *_ in observed] == [('api.catalog.export', 200)]
+    # the queries of the albums and the songs of the body
+    sql = [query[1] for query in traces[0].queries]
+    assert any('"favorites"' in query or '`favorites`' in query for query in sql)
+    assert any('"music"' in query or '`music`' in query for query in sql)
@@ -0,0 +1,128 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import json
+import threading
+
+from providers import AsyncDatabaseProvider, DatabaseProvider
+
+from helpers import song
+
+
+def _export(client, query=''):
+    response = client.get('/music/export' + query)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_export_streams_the_albums_and_then_the_songs(client, album_id, monkeypatch):
+    # several chunks of rows
+    monkeypatch.setattr(DatabaseProvider, 'EXPORT_CHUNK_SIZE', 2)
+    other_id = client.post('/music/albums', json={'band': 'Other', 'title': 'Other', 'year': '2000'}).json['id']
+    for index in range(3):
+        client.post('/music/fav_songs', json=song(album_id, 'Song {}'.format(index), 'song_{}.mp3'.format(index),
+                                                  score=index * 3))
+    lines = _export(client)
+    assert [(line['type'], line['data']['id']) for line in lines[:2]] == [('album', album_id), ('album', other_id)]
+    assert [(line['type'], line['data']['title']) for line in lines[2:]] == [('song', 'Song 0'), ('song', 'Song 1'),
+                                                                              ('song', 'Song 2')]
+    assert lines[2]['data']['album']['id'] == album_id
+    assert [line['data']['title'] for line in _export(client, '?tables=songs&score=2')] == ['Song 1', 'Song 2']
+
+
+def _run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(asyncio.wait_for(coroutine, 10))
+
+
+async def _async_export(lines_read=None, threads=None):
+    """Gets the lines of an export of the AsyncDatabaseProvider, or only the first ones and then stops it.
+    The threads running while it's read are added to threads if given.
+    """
+    lines = []
+    chunks = AsyncDatabaseProvider.AsyncDatabaseProvider().export_catalog()
+    try:
+        async for chunk in chunks:
+            lines.extend(json.loads(line) for line in chunk.splitlines())
+            if threads is not None:
+                threads.append(threading.active_count())
+            if lines_read is not None and len(lines) >= lines_read:
+                break
+    finally:
+        await chunks.aclose()
+    return lines
+
+
+def test_async_exports_share_the_threads_of_the_queries(provider, album_id, monkeypatch):
+    monkeypatch.setattr(AsyncDatabaseProvider, '_executor', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(AsyncDatabaseProvider, 'EXPORT_CHUNK_SIZE', 1)
+    provider.create_song(song(album_id, 'Song', 'song.mp3'))
+    threads_before = threading.active_count()
+    threads = []
+    exports = _run(asyncio.gather(*[_async_export(threads=threads) for _ in range(3)]))
+    assert [[line['type'] for line in lines] for lines in exports] == [['album', 'song']] * 3
+    # the thread of the executor
+    assert max(threads) == threads_before + 1
+
+
+def test_async_export_stopped_gives_back_its_connection(provider, monkeypatch):
+    monkeypatch.setattr(AsyncDatabaseProvider, '_executor', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(AsyncDatabaseProvider, 'EXPORT_CHUNK_SIZE', 1)
+    for index in range(10):
+        provider.create_album({'band': 'Band', 'title': 'Album {}'.format(index), 'year': '2000'})
+    assert len(_run(_async_export(lines_read=1))) == 1
+    assert DatabaseProvider.get_connection_pool_stats().get('in_use', 0) == 0
+    # the thread of the export is free for the next queries
+    assert _run(AsyncDatabaseProvider.AsyncDatabaseProvider().get_data_version()) == 10
+
+
+def test_search_albums_and_songs(client, album_id):
+    other_id = client.post('/music/albums', json={'band': 'Nightwish', 'title': 'Oceanborn', 'year': '1998',
+                                                  'review': 'Symphonic metal with operatic vocals'}).json['id']
+    client.post('/music/fav_songs', json=song(other_id, 'Stargazers', 'stargazers.mp3'))
+    client.post('/music/fav_songs', json=song(album_id, 'Ocean soul', 'ocean_soul.mp3'))
+    result = client.get('/music/search?q=ocean').json
+    # whole words or their beginning, in the band, title and review of the albums and the title of the songs
+    assert [album['id'] for album in result['albums']] == [other_id]
+    assert [song['title'] for song in result['songs']] == ['Ocean soul']
+    assert result['songs'][0]['album']['id'] == album_id
+    assert [album['id'] for album in client.get('/music/search?q=operatic').json['albums']] == [other_id]
+    # all the words have to match
+    assert client.get('/music/search?q=symphonic+jazz').json == {'albums': [], 'songs': []}
+    assert client.get('/music/search?q=star&tables=songs').json == {
+        'songs': [client.get('/music/search?q=stargazers').json['songs'][0]]}
+    assert client.get('/music/search?q=%21%21').status_code == 400
+
+
+def test_search_by_pages(client, album_id):
+    for index in range(3):
+        client.post('/music/fav_songs', json=song(album_id, 'Song {}'.format(index), 'song_{}.mp3'.format(index)))
+    first_page = client.get('/music/search?q=song&tables=songs&limit=2')
+    assert len(first_page.json['songs']) == 2
+    assert first_page.headers['X-Next-After'] == '2'
+    last_page = client.get('/music/search?q=song&tables=songs&limit=2&after=2')
+    assert 'X-Next-After' not in last_page.headers
+    assert sorted(song['title'] for page in (first_page, last_page) for song in page.json['songs']) == [
+        'Song 0', 'Song 1', 'Song 2']
+
+
+def test_stats(client, album_id):
+    other_id = client.post('/music/albums', json={'band': 'Other', 'title': 'Other', 'year': '2000', 'style': 'Jazz',
+                                                  'country': 'Sweden', 'type': 'LP'}).json['id']
+    client.post('/music/albums', json={'band': 'Other', 'title': 'Unscored', 'year': '2000', 'score': '?'})
+    for index, score in enumerate((2.5, 9, 9.5)):
+        client.post('/music/fav_songs', json=song(other_id, 'Song {}'.format(index), 'song_{}.mp3'.format(index),
+                                                  score=score))
+    stats = client.get('/music/stats').json
+    assert (stats['albums'], stats['songs'], stats['bands']) == (3, 3, 2)
+    assert stats['albums_by_band'] == [{'band': 'Other', 'albums': 2}, {'band': 'Band', 'albums': 1}]
+    assert stats['songs_by_band'] == [{'band': 'Other', 'songs': 3}]
+    assert stats['albums_by_year'] == [{'year': 1990, 'albums': 1}, {'year': 2000, 'albums': 2}]
+    assert {'style': 'Jazz', 'albums': 2} in stats['albums_by_style']
+    assert stats['album_scores'] == [{'score': None, 'albums': 2}, {'score': 8, 'albums': 1}]
+    assert stats['song_scores'] == [{'score': 2, 'songs': 1}, {'score': 9, 'songs': 2}]
+    assert client.get('/music/stats?top=1').json['albums_by_band'] == [{'band': 'Other', 'albums': 2}]
+    # computed again for a new version of the data
+    client.delete('/music/albums?album_id={}'.format(album_id))
+    new_stats = client.get('/music/stats').json
+    assert (new_stats['albums'], new_stats['bands']) == (2, 1)
+    assert new_stats['version'] == stats['version'] + 1
@@ -0,0 +1,42 @@
+from config import config
+from providers import DatabaseProvider
+from providers.DatabaseProvider import Change
+
+from helpers import song
+
+
+def test_changes_since_a_version(client, album_id):
+    version = client.get('/music/changes?since=0').json['version']
+    first = client.post('/music/fav_songs', json=song(album_id, 'First', 'first.mp3')).json
+    second = client.post('/music/fav_songs', json=song(album_id, 'Second', 'second.mp3')).json
+    client.delete('/music/fav_songs?song_id={}'.format(first['id']))
+    changes = client.get('/music/changes?since={}'.format(version)).json
+    assert changes['version'] == version + 3
+    assert changes['albums'] == []
+    assert [song['id'] for song in changes['songs']] == [second['id']]
+    assert changes['songs'][0]['album']['id'] == album_id
+    assert changes['deleted_songs'] == [first['id']]
+    assert client.get('/music/changes?since={}'.format(version + 3)).json['songs'] == []
+
+
+def test_changes_log_is_pruned(provider, album_id, monkeypatch):
+    monkeypatch.setattr(config, 'CHANGES_RETENTION_VERSIONS', 3)
+    monkeypatch.setattr(DatabaseProvider, 'CHANGES_PRUNE_INTERVAL', 2)
+    for index in range(5):
+        provider.create_song(song(album_id, 'Song {}'.format(index), 'song_{}.mp3'.format(index)))
+    with DatabaseProvider.database.connection_context():
+        versions = sorted({version for version, in Change.select(Change.version).tuples()})
+    # the album and the songs, pruned on version 6 keeping the last 3 versions
+    assert provider.get_data_version() == 6
+    assert versions == [4, 5, 6]
+
+
+def test_changes_older_than_the_log_are_gone(client, provider, album_id, monkeypatch):
+    monkeypatch.setattr(config, 'CHANGES_RETENTION_VERSIONS', 2)
+    for index in range(3):
+        client.post('/music/fav_songs', json=song(album_id, 'Song {}'.format(index), 'song_{}.mp3'.format(index)))
+    version = provider.get_data_version()
+    response = client.get('/music/changes?since={}'.format(version - 3))
+    assert response.status_code == 410
+    assert response.json == {'version': version, 'oldest_version': version - 2}
+    assert client.get('/music/changes?since={}'.format(version - 2)).status_code == 200
@@ -0,0 +1,52 @@
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+import pytest
+
+import async_app
+
+from helpers import song
+
+
+@pytest.mark.parametrize('path', ['/music/albums', '/music/albums?band=Band', '/music/fav_songs?limit=10',
+                                  '/music/export', '/music/search?q=band', '/music/stats'])
+def test_unchanged_data_is_not_modified(client, album_id, path):
+    client.post('/music/fav_songs', json=song(album_id, 'Song', 'song.mp3'))
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    client.put('/music/albums', json={'id': str(album_id), 'band': 'Band', 'title': 'Renamed', 'year': '1990'})
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+@pytest.mark.parametrize('path', ['/music/albums?quantity=1', '/music/albums?quantity=1&min_score=1',
+                                  '/music/fav_songs?quantity=1', '/music/playlist?quantity=1'])
+def test_random_results_are_never_not_modified(client, album_id, path):
+    client.post('/music/fav_songs', json=song(album_id, 'Song', 'song.mp3'))
+    etag = client.get('/music/albums').headers['ETag']
+    for _ in range(2):
+        response = client.get(path, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
+        assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_async_random_results_are_never_not_modified(provider, album_id):
+    async def check():
+        async with TestClient(TestServer(async_app.app)) as async_client:
+            response = await async_client.get('/music/albums')
+            etag = response.headers['ETag']
+            response = await async_client.get('/music/albums', headers={'If-None-Match': etag})
+            assert response.status == 304
+            for path in ('/music/albums?quantity=1', '/music/fav_songs?quantity=1', '/music/playlist?quantity=1'):
+                response = await async_client.get(path, headers={'If-None-Match': etag})
+                assert response.status == 200
+                assert 'ETag' not in response.headers
+                assert response.headers['Cache-Control'] == 'no-store'
+
+    asyncio.get_event_loop().run_until_complete(check())
@@ -0,0 +1,21 @@
+from providers.LruCache import LruCache
+
+
+def test_put_many_evicts_the_least_recently_used_entries():
+    cache = LruCache(2)
+    cache.put_many({1: 'a', 2: 'b'})
+    cache.get_many([1])
+    cache.put_many({3: 'c'})
+    assert cache.get_many([1, 2, 3]) == {1: 'a', 3: 'c'}
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_put_many_skips_entries_read_before_an_invalidation():
+    cache = LruCache(10)
+    generation = cache.get_generation()
+    # the entry is changed and invalidated while it's being read
+    cache.invalidate([1])
+    cache.put_many({1: 'old'}, generation)
+    assert cache.get_many([1]) == {}
+    cache.put_many({1: 'new'}, cache.get_generation())
+    assert cache.get_many([1]) == {1: 'new'}
@@ -0,0 +1,64 @@
+from peewee import IntegrityError, SqliteDatabase
+import pytest
+
+from providers.DatabaseProvider import Album, Favorites, DataVersion
+from providers.Migrations import migrate, MIGRATIONS
+
+from helpers import create_legacy_tables
+
+ADDED_INDEXES = {'favorites_disc_id_track_title_unique', 'favorites_disc_id_file_name_unique', 'favorites_score',
+                 'music_mark_value', 'music_groupName_title_year'}
+
+
+def _indexes(database):
+    return {index.name for table in ('music', 'favorites') for index in database.get_indexes(table)}
+
+
+def _check_integrity(database):
+    if isinstance(database, SqliteDatabase):
+        assert database.execute_sql('PRAGMA integrity_check').fetchall() == [('ok',)]
+
+
+def test_migrate_new_database(empty_database):
+    assert migrate() == [name for name, _ in MIGRATIONS]
+    with empty_database.connection_context():
+        assert DataVersion.select(DataVersion.version).scalar() == 0
+        assert ADDED_INDEXES <= _indexes(empty_database)
+        _check_integrity(empty_database)
+    # applied only once
+    assert migrate() == []
+
+
+def test_migrate_existing_tables(empty_database):
+    first, second = create_legacy_tables()
+    assert migrate() == [name for name, _ in MIGRATIONS]
+    with empty_database.connection_context():
+        _check_integrity(empty_database)
+        assert dict(Album.select(Album.id, Album.score_value).tuples()) == {first: 7.5, second: None}
+        assert ADDED_INDEXES <= _indexes(empty_database)
+        assert Favorites.select().count() == 1
+
+
+def test_migrate_existing_tables_merges_duplicated_favorites(empty_database):
+    first, _ = create_legacy_tables()
+    with empty_database.connection_context():
+        duplicate = Favorites.insert(album_id=first, title='Song', file_name='other.mp3', score=0, track_number=0,
+                                     type=None).execute()
+    assert migrate() == [name for name, _ in MIGRATIONS]
+    with empty_database.connection_context():
+        _check_integrity(empty_database)
+        # the last song is kept, with the values missing in it taken from the song merged into it
+        songs = list(Favorites.select().dicts())
+        assert songs == [{'id': duplicate, 'album_id': first, 'title': 'Song', 'file_name': 'other.mp3',
+                          'score': 0, 'track_number': 0, 'type': 'mp3'}]
+
+
+@pytest.mark.parametrize('column', ['track_title', 'file_name'])
+def test_migrate_adds_the_favorites_unique_keys(empty_database, column):
+    first, _ = create_legacy_tables()
+    migrate()
+    song = {'album_id': first, 'title': 'Song', 'file_name': 'song.mp3'}
+    song['title' if column == 'file_name' else 'file_name'] = 'different'
+    with empty_database.connection_context():
+        with pytest.raises(IntegrityError):
+            Favorites.insert(score=1, **song).execute()
@@ -0,0 +1,100 @@
+import base64
+import zlib
+
+import pytest
+
+from providers import Playlist
+from providers.RandomSampler import RandomSampler
+
+from helpers import song
+
+
+def _sampler(songs):
+    """Gets a playlist sampler of the given (id, score, album id, band) songs."""
+    return RandomSampler(lambda: songs, weight=lambda score: 1 + max(score, 0))
+
+
+def _songs(bands, albums_per_band, songs_per_album):
+    return [((band_index * albums_per_band + album) * songs_per_album + index + 1, 5.0,
+             band_index * albums_per_band + album + 1, band)
+            for band_index, band in enumerate(bands) for album in range(albums_per_band)
+            for index in range(songs_per_album)]
+
+
+def _min_spacing(played, key):
+    """Gets the minimum number of songs between two songs with the same key."""
+    last_positions = {}
+    spacing = None
+    for position, data in enumerate(played):
+        if key(data) in last_positions:
+            distance = position - last_positions[key(data)] - 1
+            spacing = distance if spacing is None else min(spacing, distance)
+        last_positions[key(data)] = position
+    return spacing
+
+
+def test_pick_songs_keeps_the_spacing_of_bands_and_albums():
+    songs = _songs(['A', 'B', 'C', 'D', 'E'], 3, 4)
+    data = {song_id: (album_id, band) for song_id, _, album_id, band in songs}
+    picked = Playlist.pick_songs(_sampler(songs), 40, None, [], [], 3, 6)
+    assert len(set(picked)) == 40
+    played = [data[song_id] for song_id in picked]
+    assert _min_spacing(played, lambda album_band: album_band[1]) >= 3
+    assert _min_spacing(played, lambda album_band: album_band[0]) >= 6
+
+
+def test_pick_songs_relaxes_the_spacing_when_no_song_keeps_it():
+    songs = _songs(['A', 'B'], 1, 5)
+    picked = Playlist.pick_songs(_sampler(songs), 10, None, [], [], 3, 3)
+    # all the songs, without repeating them
+    assert sorted(picked) == [song_id for song_id, *_ in songs]
+
+
+def test_pick_songs_skips_the_history_until_all_the_songs_were_played():
+    songs = _songs(['A', 'B', 'C'], 2, 2)
+    history = [song_id for song_id, *_ in songs[:10]]
+    picked = Playlist.pick_songs(_sampler(songs), 4, None, history, [], 0, 0)
+    # the 2 songs left and then the history starts again
+    assert set(picked[:2]) == {11, 12}
+    assert len(set(picked)) == 4
+
+
+def test_pick_songs_over_a_score():
+    songs = [(1, 2.0, 1, 'A'), (2, 8.0, 2, 'B'), (3, 9.0, 3, 'C')]
+    assert sorted(Playlist.pick_songs(_sampler(songs), 10, 5, [], [], 0, 0)) == [2, 3]
+
+
+def test_continuation_tokens():
+    song_ids = list(range(10 ** 9, 10 ** 9 + 1000))
+    assert Playlist.decode_history(Playlist.encode_history(song_ids)) == song_ids
+
+
+@pytest.mark.parametrize('token', [
+    'not a token',
+    base64.urlsafe_b64encode(b'not compressed').decode(),
+    base64.urlsafe_b64encode(zlib.compress(b'{"not": "a list"}')).decode(),
+    base64.urlsafe_b64encode(zlib.compress(b'[1, "2"]')).decode(),
+    # truncated
+    Playlist.encode_history([1, 2, 3])[:-8],
+    # inflates to much more than any valid token
+    base64.urlsafe_b64encode(zlib.compress(b'[' + b'1,' * 4000000 + b'1]', 9)).decode(),
+])
+def test_invalid_continuation_tokens(token):
+    with pytest.raises(ValueError):
+        Playlist.decode_history(token)
+
+
+def test_playlists_continue_without_repeating_songs(client, album_id):
+    other_id = client.post('/music/albums', json={'band': 'Other', 'title': 'Other', 'year': '2000'}).json['id']
+    song_ids = {client.post('/music/fav_songs', json=song(album, 'Song {}'.format(index),
+                                                          'song_{}.mp3'.format(index))).json['id']
+                for index, album in enumerate([album_id, other_id] * 5)}
+    url = '/music/playlist?band_spacing=1&album_spacing=0&history=10&quantity='
+    first = client.get(url + '6').json
+    second = client.get(url + '4&continuation=' + first['continuation']).json
+    played = [song['id'] for playlist in (first, second) for song in playlist['songs']]
+    assert set(played) == song_ids
+    # the bands alternate, also from a playlist to the next one
+    bands = [song['album']['band'] for playlist in (first, second) for song in playlist['songs']]
+    assert all(band != next_band for band, next_band in zip(bands, bands[1:]))
+    assert client.get('/music/playlist?continuation=invalid').status_code == 400
@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from providers.DatabaseProvider import DatabaseProvider, Album, DataVersion, Favorites, database
+from providers.Migrations import migrate
+from providers.RandomSampler import RandomSampler
+
+from helpers import create_legacy_tables, song, titles, write_until_commit
+
+
+def _write_from_another_process(write):
+    """Writes without invalidating the samplers of this process, as another server process does."""
+    with database.connection_context():
+        with database.atomic():
+            write()
+            DataVersion.update(version=DataVersion.version + 1).execute()
+
+
+def test_random_songs_include_a_song_written_while_they_were_loaded(provider, album_id):
+    provider.create_song(song(album_id, 'Old', 'old.mp3'))
+
+    def write():
+        created = Favorites.create(album_id=album_id, title='New', file_name='new.mp3', score=3)
+        DatabaseProvider._data_changed(songs=[created.id])
+
+    commit = write_until_commit(write)
+    # the samplers are loaded again while the song is not committed yet
+    assert titles(provider.get_songs(quantity=10)) == {'Old'}
+    assert titles(provider.get_playlist(10)[0]) == {'Old'}
+    commit()
+    assert titles(provider.get_songs(quantity=10)) == {'Old', 'New'}
+    assert titles(provider.get_playlist(10)[0]) == {'Old', 'New'}
+
+
+def test_random_songs_include_the_songs_written_concurrently(provider, album_id):
+    writers, songs_per_writer = 4, 5
+    stop = threading.Event()
+
+    def write(writer):
+        return [provider.create_song(song(album_id, 'Song {} {}'.format(writer, index),
+                                          'song_{}_{}.mp3'.format(writer, index)))[0]['id']
+                for index in range(songs_per_writer)]
+
+    def read():
+        while not stop.is_set():
+            provider.get_songs(quantity=5)
+
+    with ThreadPoolExecutor(max_workers=writers + 1) as executor:
+        reader = executor.submit(read)
+        song_ids = [song_id for ids in executor.map(write, range(writers)) for song_id in ids]
+        stop.set()
+        reader.result()
+    assert len(set(song_ids)) == writers * songs_per_writer
+    assert {song['id'] for song in provider.get_songs(quantity=100)['songs']} == set(song_ids)
+
+
+def test_random_results_follow_the_writes_of_other_processes(provider, album_id):
+    kept, _ = provider.create_song(song(album_id, 'Kept', 'kept.mp3'))
+    deleted, _ = provider.create_song(song(album_id, 'Deleted', 'deleted.mp3'))
+    other_album, _ = provider.create_album({'band': 'Other', 'title': 'Other', 'year': '2000'})
+    assert titles(provider.get_songs(quantity=10)) == {'Kept', 'Deleted'}
+    assert titles(provider.get_playlist(10)[0]) == {'Kept', 'Deleted'}
+    assert len(provider.get_albums(10, None)[0]) == 2
+
+    def write():
+        Favorites.delete().where(Favorites.id == deleted['id']).execute()
+        Favorites.create(album_id=album_id, title='Added', file_name='added.mp3', score=3)
+        Album.delete().where(Album.id == other_album['id']).execute()
+
+    _write_from_another_process(write)
+    assert titles(provider.get_songs(quantity=10)) == {'Kept', 'Added'}
+    assert titles(provider.get_playlist(10)[0]) == {'Kept', 'Added'}
+    assert [album['id'] for album in provider.get_albums(10, None)[0]] == [album_id]
+
+
+def test_random_songs_include_legacy_songs_without_score(empty_database):
+    first, _ = create_legacy_tables()
+    migrate()
+    with database.connection_context():
+        Favorites.insert(album_id=first, title='No score', file_name='no_score.mp3', score=None).execute()
+    provider = DatabaseProvider()
+    assert titles(provider.get_songs(quantity=10)) == {'Song', 'No score'}
+    assert titles(provider.get_songs(quantity=10, score=1)) == {'Song'}
+    assert titles(provider.get_playlist(10)[0]) == {'Song', 'No score'}
+
+
+def test_sampler_loads_are_not_blocked_by_a_slow_load():
+    table = [[(1, 1.0)]]
+    first_load = threading.Event()
+    release_first_load = threading.Event()
+
+    def loader():
+        rows = table[0]
+        if not first_load.is_set():
+            first_load.set()
+            release_first_load.wait(10)
+        return rows
+
+    sampler = RandomSampler(loader)
+    slow_sample = []
+    slow = threading.Thread(target=lambda: slow_sample.append(sampler.sample(10)))
+    slow.start()
+    first_load.wait(10)
+    # the table changes while the first load is still reading it
+    table[0] = [(1, 1.0), (2, 2.0)]
+    fast_sample = []
+
+    def fast_sampling():
+        sampler.invalidate()
+        fast_sample.append(sampler.sample(10))
+
+    fast = threading.Thread(target=fast_sampling)
+    fast.start()
+    fast.join(5)
+    assert slow.is_alive()
+    assert sorted(fast_sample[0]) == [1, 2]
+    release_first_load.set()
+    slow.join(10)
+    assert slow_sample == [[1]]
+    # the older load doesn't replace the index of the newer one
+    assert sorted(sampler.sample(10)) == [1, 2]
+
+
+def test_sampler_reloads_when_synced_with_a_new_version():
+    table = [[(1, 1.0)]]
+    sampler = RandomSampler(lambda: table[0])
+    sampler.sync(1)
+    assert sampler.sample(10) == [1]
+    table[0] = [(2, 1.0)]
+    sampler.sync(1)
+    assert sampler.sample(10) == [1]
+    sampler.sync(2)
+    assert sampler.sample(10) == [2]
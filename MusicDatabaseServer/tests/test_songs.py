@@ -0,0 +1,101 @@
+from helpers import song
+
+
+def _titles(client):
+    return sorted(song['title'] for song in client.get('/music/fav_songs').json['songs'])
+
+
+def _songs(provider):
+    return {song['id']: song for song in provider.get_songs()['songs']}
+
+
+def _changed_song_ids(provider):
+    return sorted(song['id'] for song in provider.get_changes(0)['songs'])
+
+
+def test_update_songs_batch_returns_the_status_of_each_song(client, album_id):
+    existing = client.post('/music/fav_songs', json=song(album_id, 'Old', 'old.mp3')).json
+    invalid = song(album_id, 'Invalid', 'invalid.mp3', score='high')
+    response = client.put('/music/fav_songs/batch', json=[song(album_id, 'New', 'new.mp3'),
+                                                          invalid,
+                                                          song(album_id + 1, 'Lost', 'lost.mp3'),
+                                                          song(album_id, 'Old', 'old.mp3', score=9)])
+    assert response.status_code == 200
+    statuses = response.json
+    assert [status['index'] for status in statuses] == [0, 1, 2, 3]
+    assert [status['status'] for status in statuses] == [200, 400, 400, 200]
+    assert statuses[3]['id'] == existing['id']
+    assert 'Album {} not found'.format(album_id + 1) in statuses[2]['message']
+    assert _titles(client) == ['New', 'Old']
+
+
+def test_update_songs_batch_with_conflicting_songs_writes_none(client, album_id):
+    client.post('/music/fav_songs', json=song(album_id, 'First', 'first.mp3'))
+    client.post('/music/fav_songs', json=song(album_id, 'Second', 'second.mp3'))
+    # the title of a song and the file name of another one
+    response = client.put('/music/fav_songs/batch', json=[song(album_id, 'New', 'new.mp3'),
+                                                          song(album_id, 'First', 'second.mp3')])
+    assert response.status_code == 200
+    assert [status['status'] for status in response.json] == [409, 409]
+    assert _titles(client) == ['First', 'Second']
+
+
+def test_get_songs_by_pages(client, album_id):
+    song_ids = [client.post('/music/fav_songs', json=song(album_id, 'Song {}'.format(index),
+                                                          'song_{}.mp3'.format(index))).json['id']
+                for index in range(4)]
+    response = client.get('/music/fav_songs?limit=2')
+    assert [song['id'] for song in response.json['songs']] == song_ids[:2]
+    assert response.headers['X-Next-After'] == str(song_ids[1])
+    response = client.get('/music/fav_songs?limit=2&after={}'.format(song_ids[1]))
+    assert [song['id'] for song in response.json['songs']] == song_ids[2:]
+    # the last page has no next one
+    assert 'X-Next-After' not in response.headers
+
+
+def test_get_songs_with_fields(client, album_id):
+    song_id = client.post('/music/fav_songs', json=song(album_id, 'Song', 'song.mp3')).json['id']
+    assert client.get('/music/fav_songs?fields=title').json == {'songs': [{'id': song_id, 'title': 'Song'}]}
+    assert client.get('/music/fav_songs?fields=title,album.band').json == {
+        'songs': [{'id': song_id, 'title': 'Song', 'album': {'id': album_id, 'band': 'Band'}}]}
+    songs = client.get('/music/fav_songs?quantity=1&fields=album').json['songs']
+    assert set(songs[0]) == {'id', 'album'}
+    assert songs[0]['album']['title'] == 'Album'
+
+
+def test_create_song_returns_the_id_of_the_song_updated_by_title(provider, album_id):
+    created, status = provider.create_song(song(album_id, 'Song', 'song.mp3'))
+    assert status == 200
+    # a song with an unknown id but the title of an existing one updates that one
+    updated, status = provider.create_song(song(album_id, 'Song', 'other.mp3', score=5, song_id=created['id'] + 100))
+    assert status == 200
+    assert updated['id'] == created['id']
+    songs = _songs(provider)
+    assert list(songs) == [created['id']]
+    assert (songs[created['id']]['file_name'], songs[created['id']]['score']) == ('other.mp3', 5)
+    assert _changed_song_ids(provider) == [created['id']]
+
+
+def test_create_song_returns_the_id_of_the_song_updated_by_file_name(provider, album_id):
+    created, _ = provider.create_song(song(album_id, 'Song', 'song.mp3'))
+    updated, status = provider.create_song(song(album_id, 'Renamed', 'song.mp3'))
+    assert status == 200
+    assert updated['id'] == created['id']
+    assert [song['title'] for song in _songs(provider).values()] == ['Renamed']
+
+
+def test_create_song_of_an_unknown_album_is_rejected(provider, album_id):
+    _, status = provider.create_song(song(album_id + 1, 'Song', 'song.mp3'))
+    assert status == 409
+    assert _songs(provider) == {}
+
+
+def test_update_songs_returns_the_ids_of_the_songs_written(provider, album_id):
+    created, _ = provider.create_song(song(album_id, 'Song', 'song.mp3'))
+    statuses, status = provider.update_songs([song(album_id, 'Song', 'other.mp3', song_id=created['id'] + 100),
+                                              song(album_id, 'New', 'new.mp3'),
+                                              song(album_id + 1, 'Lost', 'lost.mp3')])
+    assert status == 200
+    assert [song_status['status'] for song_status in statuses] == [200, 200, 400]
+    assert statuses[0]['id'] == created['id']
+    assert set(_songs(provider)) == {created['id'], statuses[1]['id']}
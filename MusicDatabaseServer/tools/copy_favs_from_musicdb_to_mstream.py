@@ -23,7 +23,7 @@ if not args.musicdbip:
 else:
     musicdb_URL = args.musicdbip
 
-musicdb_URL = musicdb_URL + '/music/fav_songs'
+musicdb_URL = musicdb_URL + '/music/export?tables=songs'
 
 mstream_URL = f"{mstream_base_url}/db/rate-song"
 login_mstream_URL = f"{mstream_base_url}/login"
@@ -46,25 +46,9 @@ mstream_access_token = ping_data['token']
 mstream_path = ping_data['vpaths'][0]
 headers = {'content-type': 'application/json', 'x-access-token': mstream_access_token}
 
-fav_data = requests.get(url=musicdb_URL, headers={'Authorization': 'Bearer ' + os.environ.get('ACCESS_TOKEN')})
-data = json.loads(fav_data.text)
-
 if clear:
     res = requests.post(url=mstream_clear_rated_URL, headers=headers)
 
-
-print(f'There are {len(data["songs"])} favorites in my app')
-
-seen_titles = set()
-song_list = []
-for obj in data["songs"]:
-    if obj['file_name'] not in seen_titles:
-        song_list.append(obj)
-        seen_titles.add(obj['file_name'])
-
-print(f'There are {len(song_list)} favorites in my app after deduplicating')
-
-
 res = requests.get(url=mstream_all_rated_URL, headers=headers)
 json_res = json.loads(res.text)
 
@@ -80,7 +64,18 @@ for song in json_res['rated']:
 rated_files_mstream = [song["right"]["filepath"] for song in json_res['rated'] if "filepath" in song["right"]]
 rated_files_mstream = [file.lower() for file in rated_files_mstream]
 
-for song in song_list:
+# the favorites are streamed by the server, each one is processed as it arrives
+fav_res = requests.get(url=musicdb_URL, headers={'Authorization': 'Bearer ' + os.environ.get('ACCESS_TOKEN')},
+                       stream=True)
+
+# the server does not keep duplicated favorites (same album and title or file name) so there is no need to dedupe
+count_songs = 0
+for line in fav_res.iter_lines():
+    if not line:
+        continue
+    song = json.loads(line)['data']
+    count_songs += 1
+
     rating = song['score']
     rating = round(rating * 2) / 2
     file_name = song['file_name']
@@ -102,3 +97,4 @@ for song in song_list:
         else:
             print('Success with {}'.format(json_res))
 
+print(f'There are {count_songs} favorites in my app')
@@ -0,0 +1,14 @@
+'''
+Created on Oct 18, 2026
+
+@author: thrasher
+'''
+
+from app import create_app
+from providers.DatabaseProvider import close_all_connections
+
+# WSGI entry point for the production server: gunicorn -c gunicorn.conf.py wsgi:app
+# the app is loaded once in the master process (preload_app) and the workers are forked from it
+app = create_app().app
+# the workers open their own database connections
+close_all_connections()
@@ -3,8 +3,10 @@ Created on Dec 3, 2019
 
 @author: thrasher
 """
+from collections import namedtuple
 import difflib
 from functools import reduce, lru_cache
+import json
 import os
 from os.path import relpath, exists
 import dateutil.parser as date_parser
@@ -32,6 +34,20 @@ songs_logger.addHandler(songs_log_handler)
 # TODO: extend the music types
 SUPPORTED_MUSIC_TYPES = ['mp3']
 
+# maximum number of albums or songs sent to the server in a single batch request
+BATCH_SIZE = 500
+# number of albums or songs got from the server in each page
+PAGE_SIZE = 500
+# header of the server responses with the cursor of the next page
+NEXT_PAGE_HEADER = 'X-Next-After'
+
+# wrapper to deserialize each line of the catalog export with the client models
+_ExportedRow = namedtuple('_ExportedRow', 'data')
+# status of the server responses when the data did not change since the given ETag
+NOT_MODIFIED = 304
+# status of the server responses when the changes since the given version are not kept anymore
+GONE = 410
+
 
 class MusicManager:
     _collection_root = config.MUSIC_PATH
@@ -43,6 +59,10 @@ class MusicManager:
     _wrong_albums = {}
     # this tree will contain the new albums
     _new_albums = {}
+    # albums got from the database with the version of their data
+    _db_albums_cache = (None, [])
+    # favorite songs (by minimum score) got from the database with the ETag of their version
+    _db_favorites_cache = {}
 
     @classmethod
     def get_albums_from_collection(cls):
@@ -66,6 +86,123 @@ class MusicManager:
         """
         return cls._update_albums_from_collection(True)
 
+    @classmethod
+    def _iter_pages(cls, get_page, **kwargs):
+        """Iterates lazily over the pages of a paginated request to the server.
+        Args:
+            get_page(function): the client method, with http info, to get each page
+            kwargs: the arguments for the request besides the pagination ones
+        Yields:
+            the result and headers of each page
+        """
+        page_kwargs = kwargs
+        while True:
+            result, _, headers = get_page(limit=PAGE_SIZE, **page_kwargs)
+            yield result, headers
+            after = headers.get(NEXT_PAGE_HEADER)
+            if not after:
+                break
+            page_kwargs = dict(kwargs, after=after)
+
+    @classmethod
+    def _get_db_albums(cls):
+        """Gets all the albums of the database.
+        The first time they are downloaded page by page, after that only the changes since then are downloaded.
+        Returns:
+            list of albums from the database
+        """
+        version, albums = cls._db_albums_cache
+        if version is not None:
+            try:
+                changes = cls._music_db.api_catalog_get_changes(since=version)
+            except Exception as ex:
+                if not isinstance(ex, ApiException) or ex.status != GONE:
+                    config.logger.exception(f'Could not get changes since version {version}')
+                    raise ex
+                # the server doesn't keep the changes since that version anymore, all the albums are downloaded again
+                config.logger.info(f'Changes since version {version} expired, downloading all the albums')
+                changes = None
+            if changes is not None:
+                albums_by_id = {str(album.id): album for album in albums}
+                for album_id in changes.deleted_albums:
+                    albums_by_id.pop(str(album_id), None)
+                for album in changes.albums:
+                    albums_by_id[str(album.id)] = album
+                albums = list(albums_by_id.values())
+                config.logger.debug(f'Got {len(changes.albums)} albums changed since version {version}')
+                cls._db_albums_cache = (changes.version, albums)
+                return albums
+        etag = None
+        albums = []
+        for page, headers in cls._iter_pages(cls._music_db.api_albums_get_albums_with_http_info):
+            etag = etag or headers.get('ETag')
+            albums.extend(page)
+        # the ETag is the version of the data of the albums
+        cls._db_albums_cache = (int(etag.strip('"')) if etag else None, albums)
+        return albums
+
+    @classmethod
+    def _iter_favorites(cls, score=None):
+        """Iterates lazily over all the favorite songs of the database, getting them page by page.
+        Args:
+            score(float): minimum score of songs to get
+        """
+        kwargs = {'score': score} if score else {}
+        for result, _ in cls._iter_pages(cls._music_db.api_songs_get_songs_with_http_info, **kwargs):
+            yield from result.songs
+
+    @classmethod
+    def _get_db_favorites(cls, score=None):
+        """Gets the favorite songs of the database as they are streamed by the server.
+        They are only downloaded again if the data of the server changed since the last time.
+        Args:
+            score(float): minimum score of songs to get
+        Returns:
+            list of favorite songs from the database
+        """
+        etag, songs = cls._db_favorites_cache.get(score, (None, []))
+        kwargs = {'score': score} if score else {}
+        if etag:
+            kwargs['if_none_match'] = etag
+        try:
+            response = cls._music_db.api_catalog_export(tables=['songs'], _preload_content=False, **kwargs)
+        except ApiException as ex:
+            if ex.status == NOT_MODIFIED:
+                config.logger.debug('Favorite songs did not change in the database')
+                return songs
+            raise ex
+        songs = []
+        try:
+            for line in response:
+                if line.strip():
+                    row = json.loads(line)
+                    songs.append(cls._music_db.api_client.deserialize(_ExportedRow(json.dumps(row['data'])), 'Song'))
+        finally:
+            response.release_conn()
+        cls._db_favorites_cache[score] = (response.headers.get('ETag'), songs)
+        return songs
+
+    @classmethod
+    def get_albums(cls, ids):
+        """Gets the albums with the given ids from the server in a single request.
+        Args:
+            ids([int]): the database ids of the requested albums.
+        Returns:
+            [Album]: list of albums found in the database
+        """
+        try:
+            albums_list = cls._music_db.api_albums_get_albums(album_id=ids)
+        except Exception as ex:
+            config.logger.exception(f'Could not get albums with ids {ids}')
+            raise ex
+        albums = []
+        for db_album in albums_list:
+            album = Album()
+            album.merge(db_album)
+            album.in_db = True
+            albums.append(album)
+        return albums
+
     @classmethod
     def update_album(cls, album):
         """Function to update an album in the server."""
@@ -81,6 +218,40 @@ class MusicManager:
         else:
             config.logger.error(f"Some problem with validation of album {album.title}")
 
+    @classmethod
+    def update_albums(cls, albums):
+        """Function to create or update a list of albums in the server in a single request.
+        The ids of the albums are updated with the ones given by the server.
+        Args:
+            albums([Album]): the albums to update
+        Returns:
+            [Album]: the albums that could not be updated
+        """
+        valid_albums = []
+        failed_albums = []
+        for album in albums:
+            if album.validate():
+                valid_albums.append(album)
+            else:
+                config.logger.error(f"Some problem with validation of album {album.title}")
+                failed_albums.append(album)
+        for start in range(0, len(valid_albums), BATCH_SIZE):
+            batch = valid_albums[start:start + BATCH_SIZE]
+            try:
+                statuses = cls._music_db.api_albums_update_albums(batch)
+            except Exception as ex:
+                config.logger.exception(f'Could not update {len(batch)} albums')
+                raise ex
+            for status in statuses:
+                album = batch[status.index]
+                if status.status == 200:
+                    album.id = status.id
+                    config.logger.debug(f"Album {album.title} saved to the database")
+                else:
+                    config.logger.error(f"Could not update album with title {album.title}: {status.message}")
+                    failed_albums.append(album)
+        return failed_albums
+
     @classmethod
     def delete_album(cls, album):
         """Function to delete an album from the server."""
@@ -111,6 +282,39 @@ class MusicManager:
             config.logger.error(f"Some problem with validation of song {song.title}")
             raise Exception(f"Some problem with validation of song {song.title}")
 
+    @classmethod
+    def update_songs(cls, songs):
+        """Function to create or update a list of songs in the server in a single request.
+        Args:
+            songs([Song]): the songs to update
+        Returns:
+            [Song]: the songs that could not be updated
+        """
+        valid_songs = []
+        failed_songs = []
+        for song in songs:
+            if song.validate():
+                valid_songs.append(song)
+            else:
+                config.logger.error(f"Some problem with validation of song {song.title}")
+                failed_songs.append(song)
+        for start in range(0, len(valid_songs), BATCH_SIZE):
+            batch = valid_songs[start:start + BATCH_SIZE]
+            try:
+                statuses = cls._music_db.api_songs_update_songs(batch)
+            except Exception as ex:
+                config.logger.exception(f'Could not update {len(batch)} songs')
+                raise ex
+            for status in statuses:
+                song = batch[status.index]
+                if status.status == 200:
+                    song.id = status.id
+                    config.logger.debug(f"Song {song.title} saved to the database")
+                else:
+                    config.logger.error(f"Could not update song with title {song.title}: {status.message}")
+                    failed_songs.append(song)
+        return failed_songs
+
     @classmethod
     def delete_song(cls, song):
         """Function to delete a song from the server."""
@@ -134,14 +338,14 @@ class MusicManager:
         # get a list from the database with the favorite songs
         try:
             if quantity:
-                result = cls._music_db.api_songs_get_songs(quantity=quantity, score=score)
+                songs = cls._music_db.api_songs_get_songs(quantity=quantity, score=score).songs
             else:
-                result = cls._music_db.api_songs_get_songs()
+                songs = list(cls._iter_favorites())
         except Exception as ex:
             config.logger.exception('Exception when getting favorite songs')
             raise ex
         else:
-            return cls._get_songs_in_fs(result.songs)
+            return cls._get_songs_in_fs(songs)
 
     @classmethod
     def create_favorites_playlist(cls, score=None, file_path=None):
@@ -176,17 +380,13 @@ class MusicManager:
         """
         # TODO: create the interface to retrieve by ids on the server and complete it here
         try:
-            if score:
-                result = cls._music_db.api_songs_get_songs(score=score)
+            if check_collection:
+                return cls._get_songs_in_fs(cls._get_db_favorites(score))
             else:
-                result = cls._music_db.api_songs_get_songs()
+                return [Song(song) for song in cls._get_db_favorites(score)], []
         except Exception as ex:
             config.logger.exception('Exception when getting favorite songs')
             raise ex
-        if check_collection:
-            return cls._get_songs_in_fs(result.songs)
-        else:
-            return [Song(song) for song in result.songs], []
 
     @classmethod
     def add_songs_from_reviews(cls):
@@ -201,15 +401,14 @@ class MusicManager:
         """
 
         songs_not_found = []
+        songs_found = []
 
         # if the search for the collection was not performed before it will do it now
         if not cls._valid_albums:
             cls._update_albums_from_collection()
-        result = cls._music_db.api_songs_get_songs()
-        song_db_list = result.songs
         # create a dictionary with album ids as keys and list of favorite songs belonging to that album as values
         song_db_dict = {}
-        for song_db in song_db_list:
+        for song_db in cls._iter_favorites():
             if song_db.album.id in song_db_dict:
                 song_db_dict[song_db.album.id].append(song_db)
             else:
@@ -243,8 +442,15 @@ class MusicManager:
                                 # TODO: debatable if it should be initialized this way but it's compulsory so we need
                                 #  something
                                 new_song.score = album.score
-                                if not cls._search_and_update_song_file_name(new_song):
+                                if cls._search_and_update_song_file_name(new_song, update_in_db=False):
+                                    songs_found.append(new_song)
+                                else:
                                     songs_not_found.append(new_song)
+        # all the songs found are updated at once
+        if songs_found:
+            for song in cls.update_songs(songs_found):
+                songs_logger.error(f'Could not update automatically Song with title {song.title} '
+                                   f'from album title {song.album.title} and band {song.album.band}')
         return songs_not_found
 
     @classmethod
@@ -287,6 +493,8 @@ class MusicManager:
         files_list = [f for f in os.listdir(reviews_path) if os.path.isfile(os.path.join(reviews_path, f))]
         if not files_list:
             raise FileNotFoundError
+        # the albums with a review are updated at once after reading all the files
+        reviewed_albums = []
         for file_name in files_list:
             full_name = os.path.join(reviews_path, file_name)
             file_name_wo_ext = os.path.splitext(file_name)[0]  # remove file extension
@@ -312,19 +520,7 @@ class MusicManager:
                             config.logger.exception(f'Could not open file {full_name}')
                         else:
                             album_obj.review = review
-                            try:
-                                cls._valid_albums[band_key][key].merge(cls.update_album(album_obj))
-                                cls._valid_albums[band_key][key].in_db = True
-                            except:
-                                config.logger.exception(f'Could not update review for album {album_key} '
-                                                        f'for band {band_key}')
-                                cls._add_album_to_tree(cls._wrong_albums, band_key, album_key, album_obj)
-                            else:
-                                try:
-                                    # move the review file out
-                                    os.rename(full_name, os.path.join(reviews_path, 'DONE - ' + file_name))
-                                except:
-                                    config.logger.exception(f'Could not move file {file_name} to tmp')
+                            reviewed_albums.append((band_key, album_key, album_obj, full_name, file_name))
                         break
                 if not found_album:
                     config.logger.error(f'Could not find the album {album_key} for band {band_key} '
@@ -333,6 +529,24 @@ class MusicManager:
             else:
                 config.logger.error(f'Could not find the band {band_key} in the music directory.')
                 cls._add_album_to_tree(cls._wrong_albums, band_key, album_key)
+        if reviewed_albums:
+            try:
+                failed_albums = cls.update_albums([album_obj for _, _, album_obj, _, _ in reviewed_albums])
+            except:
+                config.logger.exception(f'Could not update reviews for {len(reviewed_albums)} albums')
+                failed_albums = [album_obj for _, _, album_obj, _, _ in reviewed_albums]
+            failed_albums = {id(album_obj) for album_obj in failed_albums}
+            for band_key, album_key, album_obj, full_name, file_name in reviewed_albums:
+                if id(album_obj) in failed_albums:
+                    config.logger.error(f'Could not update review for album {album_key} for band {band_key}')
+                    cls._add_album_to_tree(cls._wrong_albums, band_key, album_key, album_obj)
+                else:
+                    album_obj.in_db = True
+                    try:
+                        # move the review file out
+                        os.rename(full_name, os.path.join(reviews_path, 'DONE - ' + file_name))
+                    except:
+                        config.logger.exception(f'Could not move file {file_name} to tmp')
         return cls._valid_albums, cls._wrong_albums
 
     @classmethod
@@ -435,48 +649,54 @@ class MusicManager:
                         album_obj.title = album
                         cls._add_album_to_tree(cls._wrong_albums, band, album, album_obj)
         # now let's check the database
-        albums_list = cls._music_db.api_albums_get_albums()
-        if isinstance(albums_list, list):
-            for db_album in albums_list:
-                band_key = db_album.band.casefold().strip()
-                if band_key in cls._valid_albums:
-                    # TODO: look for an alternative solution for the albums with no year
-                    if db_album.year == '0':
-                        db_album.year = '0000'
-                    album_key = f'{db_album.year} - {db_album.title}'.strip().casefold()
-                    if album_key in cls._valid_albums[band_key]:
-                        cls._valid_albums[band_key][album_key].merge(db_album)
-                        cls._valid_albums[band_key][album_key].in_db = True
-                    else:
-                        # add it to the list of valid albums so it can be fixed from the UI
-                        cls._valid_albums[band_key][album_key] = Album()
-                        cls._valid_albums[band_key][album_key].merge(db_album)
-                        cls._valid_albums[band_key][album_key].in_db = True
-                        # log missing album from collection
-                        album_logger.error(f"{db_album.title} from {db_album.year} "
-                                           f"from {db_album.band} not found")
-                        album_logger.error(f"Albums from that band are {cls._valid_albums[band_key].keys()}")
-                        # add it to the list of wrong albums as well to inform the user
-                        cls._add_album_to_tree(cls._wrong_albums, band_key, album_key, db_album)
+        for db_album in cls._get_db_albums():
+            band_key = db_album.band.casefold().strip()
+            if band_key in cls._valid_albums:
+                # TODO: look for an alternative solution for the albums with no year
+                if db_album.year == '0':
+                    db_album.year = '0000'
+                album_key = f'{db_album.year} - {db_album.title}'.strip().casefold()
+                if album_key in cls._valid_albums[band_key]:
+                    cls._valid_albums[band_key][album_key].merge(db_album)
+                    cls._valid_albums[band_key][album_key].in_db = True
                 else:
-                    album_logger.warning(f'Band {db_album.band} not found in collection')
+                    # add it to the list of valid albums so it can be fixed from the UI
+                    cls._valid_albums[band_key][album_key] = Album()
+                    cls._valid_albums[band_key][album_key].merge(db_album)
+                    cls._valid_albums[band_key][album_key].in_db = True
+                    # log missing album from collection
+                    album_logger.error(f"{db_album.title} from {db_album.year} "
+                                       f"from {db_album.band} not found")
+                    album_logger.error(f"Albums from that band are {cls._valid_albums[band_key].keys()}")
+                    # add it to the list of wrong albums as well to inform the user
+                    cls._add_album_to_tree(cls._wrong_albums, band_key, album_key, db_album)
+            else:
+                album_logger.warning(f'Band {db_album.band} not found in collection')
         # processing all missing albums in the database
+        missing_albums = []
         for band_key, album_dict in cls._valid_albums.items():
             for album_key, album in album_dict.items():
                 if not album.in_db:
                     if add_to_db:
-                        # if we need to add to the database we call the server with this info
-                        try:
-                            cls._valid_albums[band_key][album_key].merge(cls.update_album(album))
-                            cls._valid_albums[band_key][album_key].in_db = True
-                            cls._add_album_to_tree(cls._new_albums, band_key, album_key, album)
-                        except:
-                            config.logger.exception(
-                                f"Could not add album {album.title} of band {album.band} to the db.")
-                            cls._add_album_to_tree(cls._wrong_albums, band_key, album_key, album)
+                        missing_albums.append((band_key, album_key, album))
                     else:
                         album_logger.warning(f'Album {album.title} of band {album.band} not found in database')
                         cls._add_album_to_tree(cls._wrong_albums, band_key, album_key, album)
+        if missing_albums:
+            # if we need to add to the database we call the server with all of them at once
+            try:
+                failed_albums = cls.update_albums([album for _, _, album in missing_albums])
+            except:
+                config.logger.exception(f"Could not add {len(missing_albums)} albums to the db.")
+                failed_albums = [album for _, _, album in missing_albums]
+            failed_albums = {id(album) for album in failed_albums}
+            for band_key, album_key, album in missing_albums:
+                if id(album) in failed_albums:
+                    config.logger.error(f"Could not add album {album.title} of band {album.band} to the db.")
+                    cls._add_album_to_tree(cls._wrong_albums, band_key, album_key, album)
+                else:
+                    album.in_db = True
+                    cls._add_album_to_tree(cls._new_albums, band_key, album_key, album)
         return cls._valid_albums, cls._new_albums, cls._wrong_albums
 
     @classmethod
@@ -555,12 +775,13 @@ class MusicManager:
         return existing_songs, wrong_songs
 
     @classmethod
-    def _search_and_update_song_file_name(cls, song):
+    def _search_and_update_song_file_name(cls, song, update_in_db=True):
         """Helper to add the file_name attribute to a song when it's empty.
             It will check if there is a music file within the album folder which name contains the title of the song.
             If it's found the file_name attribute will be updated.
         Arguments:
             song(Song)
+            update_in_db(bool): indicates if the song found should be updated in the server too
         Returns:
             boolean indicating if song was found or not.
         """
@@ -597,7 +818,7 @@ class MusicManager:
         if not found_song:
             songs_logger.info(f'Song with title {song.title} from album title {song.album.title} '
                               f'and band {song.album.band} not found among the files of the corresponding album')
-        else:
+        elif update_in_db:
             # if found try to update this value in the server
             try:
                 cls._music_db.api_songs_update_song(song)